@@ -1,55 +1,172 @@
+import argparse
 import os
 import csv
+import heapq
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice, repeat
 
-# Function to sort CSV rows by 'Fix Date' and 'Severity'
-def format_and_sort_csvs(folder_path):
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".csv"):
-            file_path = os.path.join(folder_path, filename)
-            
-            # Read the CSV file
+# Severity ordinals; unknown severities sort after Low
+SEVERITY_RANK = {
+    'critical': 0,
+    'high': 1,
+    'medium': 2,
+    'moderate': 2,
+    'low': 3
+}
+UNKNOWN_SEVERITY_RANK = 4
+
+# Packed key layout: severity rank in the high bits, Fix Date ordinal in the low 22 bits
+DATE_BITS = 22
+MAX_DATE_ORDINAL = datetime.max.toordinal()  # Used for invalid dates, as before
+
+def make_sort_key(fix_date_idx, severity_idx):
+    """
+    Returns the sort key function for a file's column layout.
+    The key is a packed integer: severity rank << DATE_BITS | Fix Date ordinal.
+    Each distinct Fix Date string is parsed only once.
+    """
+    ordinals = {}
+
+    def sort_key(row):
+        fix_date = row[fix_date_idx]
+        ordinal = ordinals.get(fix_date)
+        if ordinal is None:
             try:
-                with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-                    reader = csv.reader(file)
-                    header = next(reader)
-                    
-                    # Identify the columns for 'Fix Date' and 'Severity'
-                    if 'Fix Date' in header and 'Severity' in header:
-                        fix_date_idx = header.index('Fix Date')
-                        severity_idx = header.index('Severity')
-                        
-                        # Read the remaining rows
-                        rows = list(reader)
-                        
-                        # Convert 'Fix Date' to datetime for proper sorting and sort by Severity and Fix Date
-                        def sort_key(row):
-                            try:
-                                # Convert Fix Date to datetime, default to large date if invalid
-                                fix_date = datetime.strptime(row[fix_date_idx], '%Y-%m-%d')
-                            except ValueError:
-                                fix_date = datetime.max  # Assign max date for invalid formats
-                            
-                            return (row[severity_idx], fix_date)
-                        
-                        # Sort the rows
-                        rows.sort(key=sort_key)
-                        
-                        # Write the sorted rows back to the CSV file
-                        with open(file_path, mode='w', newline='', encoding='utf-8') as output_file:
-                            writer = csv.writer(output_file)
-                            writer.writerow(header)  # Write header first
-                            writer.writerows(rows)  # Write sorted rows
-                        
-                        print(f"Formatted and sorted: {filename}")
-                    else:
-                        print(f"Missing necessary columns in {filename}. Skipping.")
+                # Convert Fix Date to a day ordinal, default to the max date if invalid
+                ordinal = datetime.strptime(fix_date, '%Y-%m-%d').toordinal()
+            except ValueError:
+                ordinal = MAX_DATE_ORDINAL  # Assign max date for invalid formats
+            ordinals[fix_date] = ordinal
+
+        rank = SEVERITY_RANK.get(row[severity_idx].strip().lower(), UNKNOWN_SEVERITY_RANK)
+        return rank << DATE_BITS | ordinal
+    return sort_key
+
+def external_sort_rows(reader, sort_key, max_rows_in_memory, tmp_dir=None):
+    """
+    Yields the rows of reader in sorted order using bounded memory.
+    Sorted runs of at most max_rows_in_memory rows are spilled to temp files and k-way merged.
+    Each run row carries its precomputed key as the first column, so keys are not recomputed while merging.
+    heapq.merge prefers earlier runs on equal keys, so the result matches a stable in-memory sort.
+    """
+    runs = []
+    try:
+        while True:
+            chunk = [(sort_key(row), row) for row in islice(reader, max_rows_in_memory)]
+            if not chunk:
+                break
+            chunk.sort(key=lambda item: item[0])
+            run = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8', dir=tmp_dir)
+            csv.writer(run).writerows([key] + row for key, row in chunk)
+            run.seek(0)
+            runs.append(run)
+            del chunk
+
+        for row in heapq.merge(*(csv.reader(run) for run in runs), key=lambda row: int(row[0])):
+            yield row[1:]
+    finally:
+        for run in runs:
+            run.close()
+
+def write_temp_csv(folder_path, header, rows):
+    """Writes header and rows to a new temp file in folder_path and returns (path, row count)."""
+    row_count = 0
+    fd, tmp_path = tempfile.mkstemp(dir=folder_path, suffix='.sorting')
+    try:
+        with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(header)  # Write header first
+            for row in rows:
+                writer.writerow(row)  # Write sorted rows
+                row_count += 1
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, row_count
+
+def sort_csv_file(folder_path, filename, max_rows_in_memory=None):
+    """
+    Sorts one CSV by (Severity, Fix Date) and atomically replaces it.
+    Returns (filename, rows sorted, seconds taken, message); rows is None if the file was skipped.
+    """
+    file_path = os.path.join(folder_path, filename)
+    start = time.perf_counter()
+
+    # Read the CSV file
+    try:
+        with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            header = next(reader)
             
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+            # Identify the columns for 'Fix Date' and 'Severity'
+            if 'Fix Date' not in header or 'Severity' not in header:
+                return filename, None, 0.0, f"Missing necessary columns in {filename}. Skipping."
+
+            fix_date_idx = header.index('Fix Date')
+            severity_idx = header.index('Severity')
+            sort_key = make_sort_key(fix_date_idx, severity_idx)
+
+            # Sort the rows into a temp file; the original is only replaced once it is complete
+            if max_rows_in_memory:
+                sorted_rows = external_sort_rows(reader, sort_key, max_rows_in_memory)
+            else:
+                sorted_rows = sorted(reader, key=sort_key)
+            tmp_path, row_count = write_temp_csv(folder_path, header, sorted_rows)
+
+        # Swap the sorted file in only after the source has been closed, keeping the
+        # source's permissions (mkstemp creates the file readable by its owner only)
+        try:
+            shutil.copymode(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return filename, row_count, time.perf_counter() - start, f"Formatted and sorted: {filename}"
+    
+    except Exception as e:
+        return filename, None, 0.0, f"Error processing {filename}: {e}"
+
+# Function to sort CSV rows by 'Fix Date' and 'Severity'
+def format_and_sort_csvs(folder_path, max_rows_in_memory=None, workers=1):
+    """
+    Sorts every CSV in folder_path by (Severity, Fix Date), replacing each file atomically.
+    With max_rows_in_memory set, files are sorted with a bounded-memory external merge sort.
+    With workers > 1, files are sorted concurrently across a process pool.
+    Prints a rows-per-second summary for each file and returns the per-file results.
+    """
+    filenames = sorted(filename for filename in os.listdir(folder_path) if filename.endswith(".csv"))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sort_csv_file, repeat(folder_path), filenames, repeat(max_rows_in_memory)))
+    else:
+        results = [sort_csv_file(folder_path, filename, max_rows_in_memory) for filename in filenames]
+
+    for _, _, _, message in results:
+        print(message)
+
+    # Summary of throughput per file
+    print("\nSort summary:")
+    for filename, row_count, seconds, _ in results:
+        if row_count is None:
+            continue
+        rate = row_count / seconds if seconds > 0 else float('inf')
+        print(f"  {filename}: {row_count:,} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+
+    return results
 
-# Example folder path (replace this with your actual folder path)
-folder_path = '_Vuln1'
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sort Twistlock CSV exports by Severity and Fix Date.")
+    # Example folder path (replace this with your actual folder path)
+    parser.add_argument('folder_path', nargs='?', default='_Vuln1', help="Folder containing the CSV files")
+    parser.add_argument('--max-rows', type=int, default=None,
+                        help="Sort with bounded memory, holding at most this many rows per sorted run")
+    parser.add_argument('--workers', type=int, default=1, help="Number of files to sort concurrently (default: 1)")
+    args = parser.parse_args()
 
-# Call the function to format and sort CSV files
-format_and_sort_csvs(folder_path)
+    # Call the function to format and sort CSV files
+    format_and_sort_csvs(args.folder_path, max_rows_in_memory=args.max_rows, workers=args.workers)
@@ -1,15 +1,17 @@
 import boto3
-import time
 import logging
 import csv
 import os
 
+import ssm_fanout
+
 # Define the paths
 CSV_FILE = "workspaces_list.csv"  # Path to CSV with WorkSpace details
 LOCAL_FILE_PATH = "file_to_copy.txt"  # Local file to be copied
 REMOTE_FILE_PATH_WINDOWS = r"C:\Users\Public\file_to_copy.txt"
 REMOTE_FILE_PATH_LINUX = "/home/ec2-user/file_to_copy.txt"
 LOG_FILE = "file_copy_results.log"
+MAX_CONCURRENT_BATCHES = 8  # send_command batches in flight at once
 
 # Configure logging
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO, 
@@ -41,53 +43,58 @@ def load_workspace_instances_from_csv(csv_file):
     
     return instances
 
-def upload_file_to_workspace(instance_id, platform_type):
+def build_copy_command(platform_type, file_content):
     """
-    Uses SSM to upload a local file to the specified WorkSpace based on OS type.
+    Returns the shell command that writes the file content on a WorkSpace of the given OS type,
+    or None if the OS type is not supported.
     """
-    try:
-        # Read the content of the local file
-        with open(LOCAL_FILE_PATH, 'r') as file:
-            file_content = file.read()
-        
-        # Set remote file path based on OS type
-        if platform_type == "Windows":
-            remote_file_path = REMOTE_FILE_PATH_WINDOWS
-            command = f"echo '{file_content}' > {remote_file_path}"
-        elif platform_type == "Linux":
-            remote_file_path = REMOTE_FILE_PATH_LINUX
-            command = f"echo '{file_content}' > {remote_file_path}"
+    # Set remote file path based on OS type
+    if platform_type == "Windows":
+        remote_file_path = REMOTE_FILE_PATH_WINDOWS
+    elif platform_type == "Linux":
+        remote_file_path = REMOTE_FILE_PATH_LINUX
+    else:
+        return None
+    return f"echo '{file_content}' > {remote_file_path}"
+
+def upload_file_to_workspaces(instances):
+    """
+    Uses SSM to upload a local file to the given WorkSpaces based on OS type.
+    Instances are sent in batched, concurrent send_command calls and tracked until each
+    reaches a final status (see ssm_fanout).
+    """
+    # Read the content of the local file
+    with open(LOCAL_FILE_PATH, 'r') as file:
+        file_content = file.read()
+
+    results, api_calls = ssm_fanout.run_command_fanout(
+        ssm_client, instances, lambda platform_type: build_copy_command(platform_type, file_content),
+        max_concurrency=MAX_CONCURRENT_BATCHES
+    )
 
-        # Run the command on the WorkSpace
-        response = ssm_client.send_command(
-            InstanceIds=[instance_id],
-            DocumentName="AWS-RunShellScript",
-            Parameters={"commands": [command]},
-        )
-        
-        command_id = response['Command']['CommandId']
-        
-        # Wait for command to finish
-        time.sleep(2)
-        
-        # Check command status and retrieve output
-        result = ssm_client.get_command_invocation(
-            CommandId=command_id,
-            InstanceId=instance_id
-        )
-        
-        # Log the outcome
+    # Log the outcome
+    for result in results:
+        instance_id = result['InstanceId']
+        platform_type = result['OperatingSystem']
+        elapsed = ssm_fanout.describe_elapsed(result)
         if result['Status'] == 'Success':
-            logging.info(f"Workspace {instance_id} ({platform_type}): File copied to {remote_file_path}")
-            print(f"Workspace {instance_id} ({platform_type}): File copied to {remote_file_path}")
+            remote_file_path = REMOTE_FILE_PATH_WINDOWS if platform_type == "Windows" else REMOTE_FILE_PATH_LINUX
+            logging.info(f"Workspace {instance_id} ({platform_type}): File copied to {remote_file_path}{elapsed}")
+            print(f"Workspace {instance_id} ({platform_type}): File copied to {remote_file_path}{elapsed}")
         else:
-            error_msg = result['StandardErrorContent'].strip()
-            logging.error(f"Workspace {instance_id} ({platform_type}): Command failed - {error_msg}")
-            print(f"Workspace {instance_id} ({platform_type}): Command failed - {error_msg}")
-    
-    except Exception as e:
-        logging.error(f"Workspace {instance_id} ({platform_type}): Error - {str(e)}")
-        print(f"Workspace {instance_id} ({platform_type}): Error - {str(e)}")
+            error_msg = result['Error'].strip()
+            logging.error(f"Workspace {instance_id} ({platform_type}): Command failed{elapsed} - {error_msg}")
+            print(f"Workspace {instance_id} ({platform_type}): Command failed{elapsed} - {error_msg}")
+
+    summary = ssm_fanout.describe_api_calls(api_calls, len(results))
+    logging.info(summary)
+    print(summary)
+
+def upload_file_to_workspace(instance_id, platform_type):
+    """
+    Uses SSM to upload a local file to the specified WorkSpace based on OS type.
+    """
+    upload_file_to_workspaces([{'InstanceId': instance_id, 'OperatingSystem': platform_type}])
 
 def main():
     # Check if the local file exists
@@ -103,13 +110,8 @@ def main():
     
     print(f"Found {len(instances)} WorkSpaces in CSV. Starting file copy process...")
     
-    # Iterate over each WorkSpace and upload the file based on OS type
-    for instance in instances:
-        instance_id = instance['InstanceId']
-        platform_type = instance['OperatingSystem']
-        
-        # Upload file based on OS
-        upload_file_to_workspace(instance_id, platform_type)
+    # Upload the file to every WorkSpace based on OS type
+    upload_file_to_workspaces(instances)
 
     print("File copy process completed. Check the log file for results.")
 
@@ -1,140 +1,341 @@
+import argparse
 import requests
 import csv
+import json
 import os
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import cve_cache
+import cve_offline
+
+# Base URL of the CVE Services API; override to point at a mirror or a local stand-in server
+CVE_API_URL = cve_cache.CVE_API_URL
+
+# Output CSV and its columns
+CSV_FILE = 'cve_full_data.csv'
+CSV_HEADER = [
+    'CVE ID', 'Title', 'Severity', 'Base Score', 'Published Date', 'Impact Type', 
+    'Attack Vector', 'Attack Complexity', 'Privileges Required', 'User Interaction', 
+    'Scope', 'Confidentiality Impact', 'Integrity Impact', 'Availability Impact', 
+    'Affected Products', 'References'
+]
+
+# HTTP statuses retried with backoff in batch mode
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def parse_cve_record(cve_data):
+    """
+    Extracts the enrichment fields from a CVE JSON 5 record.
+    Returns them in save_to_csv argument order (everything after cve_id).
+    """
+    # Initialize default values in case data is missing
+    title = "N/A"
+    severity = "N/A"
+    base_score = "N/A"
+    published_date = "N/A"
+    impact_type = "N/A"
+    attack_vector = "N/A"
+    attack_complexity = "N/A"
+    privileges_required = "N/A"
+    user_interaction = "N/A"
+    scope = "N/A"
+    confidentiality_impact = "N/A"
+    integrity_impact = "N/A"
+    availability_impact = "N/A"
+    affected_products = []
+    references = []
+    
+    # Extract title and datePublic (from containers.cna)
+    if 'containers' in cve_data and 'cna' in cve_data['containers']:
+        title = cve_data['containers']['cna'].get('title', 'N/A')
+        published_date = cve_data['containers']['cna'].get('datePublic', 'N/A')
+    
+        # Extract affected products
+        affected = cve_data['containers']['cna'].get('affected', [])
+        for product in affected:
+            vendor = product.get('vendor', 'N/A')
+            prod_name = product.get('product', 'N/A')
+            versions = [v.get('version', 'N/A') for v in product.get('versions', [])]
+            affected_products.append(f"{vendor} {prod_name} versions: {', '.join(versions)}")
+    
+        # Extract references
+        references = [ref['url'] for ref in cve_data['containers']['cna'].get('references', [])]
+    
+    # Extract severity and baseScore (from containers.cna.metrics.cvssV3_1)
+    if 'containers' in cve_data and 'cna' in cve_data['containers']:
+        metrics = cve_data['containers']['cna'].get('metrics', [])
+        for metric in metrics:
+            if 'cvssV3_1' in metric:
+                severity = metric['cvssV3_1'].get('baseSeverity', 'N/A')
+                base_score = metric['cvssV3_1'].get('baseScore', 'N/A')
+                attack_vector = metric['cvssV3_1'].get('attackVector', 'N/A')
+                attack_complexity = metric['cvssV3_1'].get('attackComplexity', 'N/A')
+                privileges_required = metric['cvssV3_1'].get('privilegesRequired', 'N/A')
+                user_interaction = metric['cvssV3_1'].get('userInteraction', 'N/A')
+                scope = metric['cvssV3_1'].get('scope', 'N/A')
+                confidentiality_impact = metric['cvssV3_1'].get('confidentialityImpact', 'N/A')
+                integrity_impact = metric['cvssV3_1'].get('integrityImpact', 'N/A')
+                availability_impact = metric['cvssV3_1'].get('availabilityImpact', 'N/A')
+                break  # Exit after finding the first CVSS metrics
+    
+    # Extract impact (from containers.cna.problemTypes.descriptions[].type)
+    if 'containers' in cve_data and 'cna' in cve_data['containers']:
+        problem_types = cve_data['containers']['cna'].get('problemTypes', [])
+        for problem in problem_types:
+            if 'descriptions' in problem:
+                for description in problem['descriptions']:
+                    if description.get('type', '') == 'Impact':
+                        impact_type = description.get('description', 'N/A')
+                        break
+
+    return (title, severity, base_score, published_date, impact_type, 
+            attack_vector, attack_complexity, privileges_required, user_interaction, 
+            scope, confidentiality_impact, integrity_impact, availability_impact, 
+            affected_products, references)
+
+def format_csv_row(cve_id, fields):
+    """Builds the output CSV row for a CVE from parse_cve_record's fields."""
+    *scalars, affected_products, references = fields
+    return [cve_id, *scalars, '; '.join(affected_products), '; '.join(references)]
 
 def get_cve_data(cve_id):
     """
     Function to fetch all relevant CVE data from the CVE API based on a supplied CVE ID.
-    Appends the CVE data to a CSV file.
+    Upserts the CVE data into the keyed store; export_csv() writes it to the CSV file.
     """
-    # Define the base URL for the API
-    url = f"https://cveawg.mitre.org/api/cve/{cve_id}"
-    
     try:
-        # Make a GET request to the API
-        response = requests.get(url)
+        # Answer from the offline CVE database when it has the record
+        fields = cve_offline.lookup_cve(cve_id)
+        if fields is not None:
+            save_to_csv(cve_id, *fields)
+            return
+
+        # Fetch the record through the local cache (only hits the API when missing or stale)
+        status_code, cve_data = cve_cache.get_cve_json(cve_id, base_url=CVE_API_URL)
         
         # Check if the request was successful
-        if response.status_code == 200:
-            # Parse the JSON data returned by the API
-            cve_data = response.json()
-            
-            # Initialize default values in case data is missing
-            title = "N/A"
-            severity = "N/A"
-            base_score = "N/A"
-            published_date = "N/A"
-            impact_type = "N/A"
-            attack_vector = "N/A"
-            attack_complexity = "N/A"
-            privileges_required = "N/A"
-            user_interaction = "N/A"
-            scope = "N/A"
-            confidentiality_impact = "N/A"
-            integrity_impact = "N/A"
-            availability_impact = "N/A"
-            affected_products = []
-            references = []
-            
-            # Extract title and datePublic (from containers.cna)
-            if 'containers' in cve_data and 'cna' in cve_data['containers']:
-                title = cve_data['containers']['cna'].get('title', 'N/A')
-                published_date = cve_data['containers']['cna'].get('datePublic', 'N/A')
-            
-                # Extract affected products
-                affected = cve_data['containers']['cna'].get('affected', [])
-                for product in affected:
-                    vendor = product.get('vendor', 'N/A')
-                    prod_name = product.get('product', 'N/A')
-                    versions = [v.get('version', 'N/A') for v in product.get('versions', [])]
-                    affected_products.append(f"{vendor} {prod_name} versions: {', '.join(versions)}")
-            
-                # Extract references
-                references = [ref['url'] for ref in cve_data['containers']['cna'].get('references', [])]
-            
-            # Extract severity and baseScore (from containers.cna.metrics.cvssV3_1)
-            if 'containers' in cve_data and 'cna' in cve_data['containers']:
-                metrics = cve_data['containers']['cna'].get('metrics', [])
-                for metric in metrics:
-                    if 'cvssV3_1' in metric:
-                        severity = metric['cvssV3_1'].get('baseSeverity', 'N/A')
-                        base_score = metric['cvssV3_1'].get('baseScore', 'N/A')
-                        attack_vector = metric['cvssV3_1'].get('attackVector', 'N/A')
-                        attack_complexity = metric['cvssV3_1'].get('attackComplexity', 'N/A')
-                        privileges_required = metric['cvssV3_1'].get('privilegesRequired', 'N/A')
-                        user_interaction = metric['cvssV3_1'].get('userInteraction', 'N/A')
-                        scope = metric['cvssV3_1'].get('scope', 'N/A')
-                        confidentiality_impact = metric['cvssV3_1'].get('confidentialityImpact', 'N/A')
-                        integrity_impact = metric['cvssV3_1'].get('integrityImpact', 'N/A')
-                        availability_impact = metric['cvssV3_1'].get('availabilityImpact', 'N/A')
-                        break  # Exit after finding the first CVSS metrics
-            
-            # Extract impact (from containers.cna.problemTypes.descriptions[].type)
-            if 'containers' in cve_data and 'cna' in cve_data['containers']:
-                problem_types = cve_data['containers']['cna'].get('problemTypes', [])
-                for problem in problem_types:
-                    if 'descriptions' in problem:
-                        for description in problem['descriptions']:
-                            if description.get('type', '') == 'Impact':
-                                impact_type = description.get('description', 'N/A')
-                                break
-            
-            # Append the data to a CSV file
-            save_to_csv(cve_id, title, severity, base_score, published_date, impact_type, 
-                        attack_vector, attack_complexity, privileges_required, user_interaction, 
-                        scope, confidentiality_impact, integrity_impact, availability_impact, 
-                        affected_products, references)
+        if status_code == 200:
+            # Save the data to the keyed store
+            save_to_csv(cve_id, *parse_cve_record(cve_data))
             
         else:
-            print(f"Failed to fetch data. HTTP Status Code: {response.status_code}")
+            print(f"Failed to fetch data. HTTP Status Code: {status_code}")
     
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
+def make_session(max_workers=8, retries=5, backoff_factor=0.5):
+    """
+    Returns a requests.Session with a connection pool sized for max_workers threads.
+    429 and 5xx responses are retried with exponential backoff, honouring Retry-After.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def fetch_cve_record(session, cve_id, base_url=CVE_API_URL, ttl=cve_cache.CACHE_TTL, timeout=30):
+    """
+    Fetches and parses one CVE with a shared session, going through the offline database
+    and then the local cache.
+    Returns (cve_id, fields or None, error message or None).
+    """
+    try:
+        fields = cve_offline.lookup_cve(cve_id)
+        if fields is not None:
+            return cve_id, fields, None
+        status_code, cve_data = cve_cache.get_cve_json(cve_id, session=session, ttl=ttl, base_url=base_url, timeout=timeout)
+        if status_code != 200:
+            return cve_id, None, f"HTTP Status Code: {status_code}"
+        return cve_id, parse_cve_record(cve_data), None
+    except Exception as e:
+        return cve_id, None, str(e)
+
+def fetch_cve_batch(cve_ids, csv_file=CSV_FILE, max_workers=8, retries=5, backoff_factor=0.5, base_url=CVE_API_URL,
+                    ttl=cve_cache.CACHE_TTL):
+    """
+    Fetches many CVEs concurrently over one pooled session. Each record is upserted into the
+    keyed store as soon as it arrives, and the CSV is exported once at the end of the run.
+    Duplicate IDs are fetched once.
+    Returns (records written, list of (cve_id, error) failures).
+    """
+    unique_ids = list(dict.fromkeys(cve_id.strip() for cve_id in cve_ids if cve_id.strip()))
+    session = make_session(max_workers, retries, backoff_factor)
+    conn = open_results(csv_file)
+    failures = []
+    written = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(lambda cve_id: fetch_cve_record(session, cve_id, base_url, ttl), unique_ids)
+            for cve_id, fields, error in results:
+                if error:
+                    print(f"Failed to fetch {cve_id}: {error}")
+                    failures.append((cve_id, error))
+                    continue
+                # Committed per record, so a crash keeps everything fetched so far
+                with conn:
+                    upsert_rows(conn, [format_csv_row(cve_id, fields)])
+                written += 1
+    finally:
+        session.close()
+        conn.close()
+
+    export_csv(csv_file)
+    print(f"Fetched {written} of {len(unique_ids)} CVEs into {csv_file}")
+    return written, failures
+
+def results_db_path(csv_file=CSV_FILE):
+    """Returns the path of the keyed store behind an output CSV (cve_full_data.csv -> cve_full_data.db)."""
+    return os.path.splitext(csv_file)[0] + '.db'
+
+def load_csv_rows(csv_file=CSV_FILE):
+    """
+    Reads the existing output keyed by CVE ID, in file order.
+    Duplicate rows left by older append-only runs collapse to the last one.
+    """
+    records = {}
+    if not os.path.isfile(csv_file):
+        return records
+    with open(csv_file, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip the header
+        for row in reader:
+            if row:
+                records[row[0]] = row
+    return records
+
+def open_results(csv_file=CSV_FILE):
+    """
+    Opens (creating if needed) the store of output rows keyed by CVE ID, in first-seen order.
+    A new, empty store is seeded from an existing csv_file, so rows from earlier runs are kept.
+    """
+    conn = sqlite3.connect(results_db_path(csv_file), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cve_rows (
+            position INTEGER PRIMARY KEY,
+            cve_id TEXT NOT NULL UNIQUE,
+            row TEXT NOT NULL
+        )
+    """)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM cve_rows LIMIT 1").fetchone() is None:
+            upsert_rows(conn, load_csv_rows(csv_file).values())
+    return conn
+
+def upsert_rows(conn, rows):
+    """Inserts or replaces rows (keyed by CVE ID) in the store; existing CVEs keep their position."""
+    conn.executemany(
+        "INSERT INTO cve_rows (cve_id, row) VALUES (?, ?) ON CONFLICT (cve_id) DO UPDATE SET row = excluded.row",
+        [(row[0], json.dumps(row)) for row in rows]
+    )
+
+def export_csv(csv_file=CSV_FILE):
+    """
+    Writes every stored row to csv_file through a unique temp file and an atomic rename.
+    The store's write lock is held from the read until the rename, so an overlapping run
+    cannot replace a newer export with an older one. Returns the number of rows written.
+    """
+    conn = open_results(csv_file)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(csv_file)),
+                                    prefix=os.path.basename(csv_file) + '.', suffix='.tmp')
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row_count = 0
+            with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(CSV_HEADER)
+                for (row,) in conn.execute("SELECT row FROM cve_rows ORDER BY position"):
+                    writer.writerow(json.loads(row))
+                    row_count += 1
+            # mkstemp creates the file readable by its owner only; keep the usual mode
+            if os.path.exists(csv_file):
+                shutil.copymode(csv_file, tmp_path)
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(tmp_path, 0o666 & ~umask)
+            os.replace(tmp_path, csv_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        conn.close()
+    return row_count
+
 def save_to_csv(cve_id, title, severity, base_score, published_date, impact_type, 
                 attack_vector, attack_complexity, privileges_required, user_interaction, 
                 scope, confidentiality_impact, integrity_impact, availability_impact, 
                 affected_products, references):
     """
-    Appends all relevant CVE data to a CSV file.
+    Saves all relevant CVE data to the keyed store, replacing any earlier row for the same CVE.
+    Call export_csv() once the run is done to write the CSV file.
     """
     # Define the CSV file path
-    csv_file = 'cve_full_data.csv'
-    
-    # Check if the file exists to determine if the header is needed
-    file_exists = os.path.isfile(csv_file)
+    csv_file = CSV_FILE
 
-    # Open the CSV file in append mode
-    with open(csv_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        
-        # Write the header if the file does not exist
-        if not file_exists:
-            writer.writerow([
-                                'CVE ID', 'Title', 'Severity', 'Base Score', 'Published Date', 'Impact Type', 
-                'Attack Vector', 'Attack Complexity', 'Privileges Required', 'User Interaction', 
-                'Scope', 'Confidentiality Impact', 'Integrity Impact', 'Availability Impact', 
-                'Affected Products', 'References'
-            ])
-        
-        # Write the data
-        writer.writerow([
-            cve_id, title, severity, base_score, published_date, impact_type, 
-            attack_vector, attack_complexity, privileges_required, user_interaction, 
-            scope, confidentiality_impact, integrity_impact, availability_impact, 
-            '; '.join(affected_products), '; '.join(references)
-        ])
+    # Upsert the data keyed by CVE ID
+    conn = open_results(csv_file)
+    try:
+        with conn:
+            upsert_rows(conn, [format_csv_row(cve_id, (
+                title, severity, base_score, published_date, impact_type, 
+                attack_vector, attack_complexity, privileges_required, user_interaction, 
+                scope, confidentiality_impact, integrity_impact, availability_impact, 
+                affected_products, references
+            ))])
+    finally:
+        conn.close()
     
-    print(f"Data for {cve_id} has been appended to {csv_file}")
+    print(f"Data for {cve_id} has been saved to {results_db_path(csv_file)}")
 
 # Main function to run the script
 if __name__ == "__main__":
-    # Prompt the user to enter a CVE ID
-    cve_id = input("Enter CVE ID (e.g., CVE-2021-34527): ").strip()
-    
-    # Validate the CVE ID format
-    if not cve_id.startswith("CVE-"):
-        print("Invalid CVE ID format. Please enter a valid CVE ID.")
+    parser = argparse.ArgumentParser(description="Fetch CVE records into cve_full_data.csv. Prompts for one CVE if none are given.")
+    parser.add_argument('cve_ids', nargs='*', help="CVE IDs to fetch")
+    parser.add_argument('--file', help="File of CVE IDs, one per line")
+    parser.add_argument('--workers', type=int, default=8, help="Maximum concurrent requests (default: 8)")
+    parser.add_argument('--retries', type=int, default=5, help="Retries for 429/5xx responses (default: 5)")
+    parser.add_argument('--base-url', default=CVE_API_URL, help="CVE API base URL")
+    parser.add_argument('--cache-ttl', type=int, default=cve_cache.CACHE_TTL,
+                        help="Seconds a cached record is used before it is revalidated (0 always revalidates)")
+    args = parser.parse_args()
+
+    cve_ids = list(args.cve_ids)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            cve_ids += [line.strip() for line in f if line.strip()]
+
+    if cve_ids:
+        fetch_cve_batch(cve_ids, max_workers=args.workers, retries=args.retries, base_url=args.base_url,
+                        ttl=args.cache_ttl)
     else:
-        # Call the function to get CVE data
-        get_cve_data(cve_id)
+        # Prompt the user to enter a CVE ID
+        cve_id = input("Enter CVE ID (e.g., CVE-2021-34527): ").strip()
+        
+        # Validate the CVE ID format
+        if not cve_id.startswith("CVE-"):
+            print("Invalid CVE ID format. Please enter a valid CVE ID.")
+        else:
+            # Call the function to get CVE data, then write the CSV
+            get_cve_data(cve_id)
+            export_csv()
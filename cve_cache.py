@@ -0,0 +1,91 @@
+import json
+import os
+import sqlite3
+import time
+
+import requests
+
+# Shared on-disk cache of raw CVE JSON 5 records, used by cve.py and theat_scout.py.
+#
+# Records are keyed by API base URL and CVE ID, so records fetched from a mirror or a
+# stand-in --base-url are never served to lookups against another API. Each is stored
+# with its fetch time and the ETag / Last-Modified validators returned by the API.
+# Fresh entries (younger than the TTL) are served without a request; stale entries
+# are revalidated with a conditional GET, so an unchanged record costs a 304 instead
+# of a full download.
+
+CVE_API_URL = "https://cveawg.mitre.org/api/cve/"
+
+# Cache location and time-to-live (seconds); both can be overridden from the environment
+CACHE_DB = os.environ.get('CVE_CACHE_DB', 'cve_cache.db')
+CACHE_TTL = int(os.environ.get('CVE_CACHE_TTL', 7 * 24 * 3600))
+
+def open_cache(db_path=CACHE_DB):
+    """Opens (creating if needed) the cache database."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Caches written before records were keyed by base URL cannot tell where a record
+    # came from, so they are discarded
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(cve_records)")}
+    if columns and 'base_url' not in columns:
+        conn.execute("DROP TABLE IF EXISTS cve_records")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cve_records (
+            base_url TEXT NOT NULL,
+            cve_id TEXT NOT NULL,
+            body TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            PRIMARY KEY (base_url, cve_id)
+        )
+    """)
+    return conn
+
+def get_cve_json(cve_id, session=None, db_path=CACHE_DB, ttl=CACHE_TTL, base_url=CVE_API_URL, timeout=30):
+    """
+    Returns (HTTP status, parsed CVE JSON 5 record or None) for a CVE ID, going through the cache.
+    Cache hits and successful revalidations report 200. Network errors propagate to the caller.
+    """
+    base_url = base_url.rstrip("/")
+    conn = open_cache(db_path)
+    try:
+        row = conn.execute(
+            "SELECT body, fetched_at, etag, last_modified FROM cve_records WHERE base_url = ? AND cve_id = ?",
+            (base_url, cve_id)
+        ).fetchone()
+
+        # Fresh entry: no request at all
+        if row and time.time() - row[1] < ttl:
+            return 200, json.loads(row[0])
+
+        # Stale entry: revalidate with a conditional request
+        headers = {}
+        if row:
+            if row[2]:
+                headers['If-None-Match'] = row[2]
+            if row[3]:
+                headers['If-Modified-Since'] = row[3]
+
+        http = session or requests
+        response = http.get(base_url + "/" + cve_id, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and row:
+            conn.execute("UPDATE cve_records SET fetched_at = ? WHERE base_url = ? AND cve_id = ?",
+                         (time.time(), base_url, cve_id))
+            conn.commit()
+            return 200, json.loads(row[0])
+
+        if response.status_code != 200:
+            return response.status_code, None
+
+        cve_data = response.json()
+        conn.execute(
+            "INSERT OR REPLACE INTO cve_records (base_url, cve_id, body, fetched_at, etag, last_modified) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (base_url, cve_id, response.text, time.time(), response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        )
+        conn.commit()
+        return 200, cve_data
+    finally:
+        conn.close()
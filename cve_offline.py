@@ -0,0 +1,171 @@
+import argparse
+import io
+import json
+import os
+import sqlite3
+import zipfile
+
+# Offline CVE database built from a local CVE JSON 5 dump (a cvelistV5 checkout or
+# release zip). Each record is reduced to the fields cve.get_cve_data extracts and
+# stored in an indexed SQLite table, so lookups work in air-gapped enclaves and
+# without a per-CVE HTTP round trip.
+#
+# Every stored record remembers a signature of its source file (size + mtime for
+# directories, size + CRC for zip members); re-imports skip records whose
+# signature is unchanged without parsing them.
+
+OFFLINE_DB = os.environ.get('CVE_OFFLINE_DB', 'cve_offline.db')
+
+# Stored columns, in cve.parse_cve_record order
+FIELD_COLUMNS = [
+    'title', 'severity', 'base_score', 'published_date', 'impact_type',
+    'attack_vector', 'attack_complexity', 'privileges_required', 'user_interaction',
+    'scope', 'confidentiality_impact', 'integrity_impact', 'availability_impact',
+    'affected_products', 'reference_urls'
+]
+
+# Records are committed in batches of this size during an import
+COMMIT_BATCH = 5000
+
+def open_db(db_path=OFFLINE_DB):
+    """Opens (creating if needed) the offline CVE database."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS cve_records (
+            cve_id TEXT PRIMARY KEY,
+            source_sig TEXT NOT NULL,
+            {', '.join(f'{column} TEXT' for column in FIELD_COLUMNS)}
+        )
+    """)
+    return conn
+
+def _cve_id_from_name(name):
+    """Returns the CVE ID for a record file name such as cves/2024/1xxx/CVE-2024-1234.json, or None."""
+    base = os.path.basename(name)
+    if base.startswith('CVE-') and base.endswith('.json'):
+        return base[:-len('.json')]
+    return None
+
+def iter_dump_records(source):
+    """
+    Yields (cve_id, source signature, opener) for every record in a dump directory or zip.
+    opener() returns a binary file object for the record. Nested zips (as shipped in
+    cvelistV5 release archives) are followed.
+    """
+    if os.path.isdir(source):
+        for dirpath, _, filenames in os.walk(source):
+            for filename in filenames:
+                cve_id = _cve_id_from_name(filename)
+                if cve_id:
+                    path = os.path.join(dirpath, filename)
+                    stat = os.stat(path)
+                    yield cve_id, f"{stat.st_size}:{stat.st_mtime_ns}", lambda path=path: open(path, 'rb')
+    else:
+        with zipfile.ZipFile(source) as archive:
+            yield from _iter_zip_records(archive)
+
+def _iter_zip_records(archive):
+    for info in archive.infolist():
+        if info.filename.endswith('.zip'):
+            with archive.open(info) as nested_file, zipfile.ZipFile(nested_file) as nested:
+                yield from _iter_zip_records(nested)
+            continue
+        cve_id = _cve_id_from_name(info.filename)
+        if cve_id:
+            yield cve_id, f"{info.file_size}:{info.CRC:08x}", lambda info=info: archive.open(info)
+
+def import_cve_dump(source, db_path=OFFLINE_DB):
+    """
+    Streams a CVE JSON 5 dump into the offline database.
+    Only records that are new or whose source file changed are parsed and written;
+    records that cannot be parsed are skipped, and records missing from the dump are
+    removed, so the database mirrors the dump it was last imported from.
+    Returns (records seen, records imported, records removed).
+    """
+    # Imported here so cve.py can use this module without a circular import
+    from cve import parse_cve_record
+
+    conn = open_db(db_path)
+    try:
+        known = dict(conn.execute("SELECT cve_id, source_sig FROM cve_records"))
+        insert = (f"INSERT OR REPLACE INTO cve_records (cve_id, source_sig, {', '.join(FIELD_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' * (len(FIELD_COLUMNS) + 2))})")
+        seen = imported = 0
+        batch = []
+        seen_ids = set()
+        for cve_id, source_sig, opener in iter_dump_records(source):
+            seen += 1
+            seen_ids.add(cve_id)
+            if known.get(cve_id) == source_sig:
+                continue
+            try:
+                with opener() as record_file:
+                    cve_data = json.load(io.TextIOWrapper(record_file, encoding='utf-8'))
+                fields = parse_cve_record(cve_data)
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # Unreadable or malformed record: skip it and keep importing
+                print(f"Skipping {cve_id}: {e!r}")
+                continue
+
+            # Field values are stored JSON-encoded so scores keep their numeric type
+            batch.append((cve_id, source_sig, *(json.dumps(value) for value in fields)))
+            if len(batch) >= COMMIT_BATCH:
+                conn.executemany(insert, batch)
+                conn.commit()
+                imported += len(batch)
+                batch = []
+
+        if batch:
+            conn.executemany(insert, batch)
+            conn.commit()
+            imported += len(batch)
+
+        # Drop records that are no longer in the dump
+        removed = [(cve_id,) for cve_id in known if cve_id not in seen_ids]
+        conn.executemany("DELETE FROM cve_records WHERE cve_id = ?", removed)
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"Imported {imported} new or changed records, removed {len(removed)} ({seen} records in {source}).")
+    return seen, imported, len(removed)
+
+def lookup_cve(cve_id, db_path=OFFLINE_DB):
+    """
+    Returns the stored fields for a CVE in cve.parse_cve_record order, or None if the
+    database does not exist or does not contain the CVE.
+    """
+    if not os.path.exists(db_path):
+        return None
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        row = conn.execute(
+            f"SELECT {', '.join(FIELD_COLUMNS)} FROM cve_records WHERE cve_id = ?", (cve_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return tuple(json.loads(value) for value in row)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the offline CVE database.")
+    parser.add_argument('--db', default=OFFLINE_DB, help=f"Database path (default: {OFFLINE_DB})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="Import a cvelistV5 directory or zip")
+    import_parser.add_argument('source', help="Path to the dump directory or zip file")
+    show_parser = subparsers.add_parser('show', help="Print the stored fields for a CVE")
+    show_parser.add_argument('cve_id')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        import_cve_dump(args.source, args.db)
+    else:
+        fields = lookup_cve(args.cve_id, args.db)
+        if fields is None:
+            print(f"{args.cve_id} not found in {args.db}")
+        else:
+            for column, value in zip(FIELD_COLUMNS, fields):
+                print(f"{column}: {value}")
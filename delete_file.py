@@ -1,11 +1,13 @@
 import boto3
-import time
 import logging
 import csv
 
+import ssm_fanout
+
 # Define the CSV file path and the log file
 CSV_FILE = "workspaces_list.csv"
 LOG_FILE = "remove_nessus_agent_results.log"
+MAX_CONCURRENT_BATCHES = 8  # send_command batches in flight at once
 
 # Configure logging
 logging.basicConfig(filename=LOG_FILE, level=logging.INFO, 
@@ -37,52 +39,56 @@ def load_workspace_instances_from_csv(csv_file):
     
     return instances
 
-def remove_nessus_agent_on_workspace(instance_id, platform_type):
+def build_removal_command(platform_type):
     """
-    Uses SSM to remove the Nessus Agent based on the OS type of the WorkSpace.
-    Logs the result for each WorkSpace.
+    Returns the command that removes the Nessus Agent on a WorkSpace of the given OS type,
+    or None if the OS type is not supported.
     """
     if platform_type == "Windows":
         # Command to remove Nessus Agent on Windows
-        command = r'"C:\Program Files\Tenable\Nessus Agent\nessuscli.exe" agent unlink && ' \
-                  r'rmdir /S /Q "C:\ProgramData\Tenable\Nessus Agent"'
+        return r'"C:\Program Files\Tenable\Nessus Agent\nessuscli.exe" agent unlink && ' \
+               r'rmdir /S /Q "C:\ProgramData\Tenable\Nessus Agent"'
     elif platform_type == "Linux":
         # Command to remove Nessus Agent on Linux
-        command = 'sudo /opt/nessus_agent/sbin/nessuscli agent unlink && ' \
-                  'sudo rm -rf /opt/nessus_agent'
+        return 'sudo /opt/nessus_agent/sbin/nessuscli agent unlink && ' \
+               'sudo rm -rf /opt/nessus_agent'
+    return None
 
-    try:
-        # Run command on the WorkSpace
-        response = ssm_client.send_command(
-            InstanceIds=[instance_id],
-            DocumentName="AWS-RunShellScript",
-            Parameters={"commands": [command]},
-        )
-        
-        command_id = response['Command']['CommandId']
-        
-        # Wait for command to finish
-        time.sleep(2)
-        
-        # Check command status and retrieve output
-        result = ssm_client.get_command_invocation(
-            CommandId=command_id,
-            InstanceId=instance_id
-        )
-        
-        # Log the outcome
+def remove_nessus_agent_on_workspaces(instances):
+    """
+    Uses SSM to remove the Nessus Agent from the given WorkSpaces based on OS type.
+    Instances are sent in batched, concurrent send_command calls and tracked until each
+    reaches a final status (see ssm_fanout).
+    Logs the result for each WorkSpace.
+    """
+    results, api_calls = ssm_fanout.run_command_fanout(
+        ssm_client, instances, build_removal_command, max_concurrency=MAX_CONCURRENT_BATCHES
+    )
+
+    # Log the outcome
+    for result in results:
+        instance_id = result['InstanceId']
+        platform_type = result['OperatingSystem']
+        elapsed = ssm_fanout.describe_elapsed(result)
         if result['Status'] == 'Success':
-            output = result['StandardOutputContent'].strip()
-            logging.info(f"Workspace {instance_id} ({platform_type}): {output}")
-            print(f"Workspace {instance_id} ({platform_type}): {output}")
+            output = result['Output'].strip()
+            logging.info(f"Workspace {instance_id} ({platform_type}){elapsed}: {output}")
+            print(f"Workspace {instance_id} ({platform_type}){elapsed}: {output}")
         else:
-            error_msg = result['StandardErrorContent'].strip()
-            logging.error(f"Workspace {instance_id} ({platform_type}): Command failed - {error_msg}")
-            print(f"Workspace {instance_id} ({platform_type}): Command failed - {error_msg}")
-    
-    except Exception as e:
-        logging.error(f"Workspace {instance_id} ({platform_type}): Error - {str(e)}")
-        print(f"Workspace {instance_id} ({platform_type}): Error - {str(e)}")
+            error_msg = result['Error'].strip()
+            logging.error(f"Workspace {instance_id} ({platform_type}): Command failed{elapsed} - {error_msg}")
+            print(f"Workspace {instance_id} ({platform_type}): Command failed{elapsed} - {error_msg}")
+
+    summary = ssm_fanout.describe_api_calls(api_calls, len(results))
+    logging.info(summary)
+    print(summary)
+
+def remove_nessus_agent_on_workspace(instance_id, platform_type):
+    """
+    Uses SSM to remove the Nessus Agent based on the OS type of the WorkSpace.
+    Logs the result for each WorkSpace.
+    """
+    remove_nessus_agent_on_workspaces([{'InstanceId': instance_id, 'OperatingSystem': platform_type}])
 
 def main():
     # Load list of WorkSpaces from CSV file
@@ -93,13 +99,8 @@ def main():
     
     print(f"Found {len(instances)} WorkSpaces in CSV. Starting Nessus Agent removal process...")
     
-    # Iterate over each WorkSpace and remove the Nessus Agent based on OS type
-    for instance in instances:
-        instance_id = instance['InstanceId']
-        platform_type = instance['OperatingSystem']
-        
-        # Remove Nessus Agent based on OS
-        remove_nessus_agent_on_workspace(instance_id, platform_type)
+    # Remove the Nessus Agent from every WorkSpace based on OS type
+    remove_nessus_agent_on_workspaces(instances)
 
     print("Nessus Agent removal process completed. Check the log file for results.")
 
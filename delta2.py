@@ -1,6 +1,18 @@
+import argparse
 import csv
+import hashlib
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from itertools import repeat
+
+import vuln_cache
+
+try:
+    import numpy as np
+except ImportError:  # calculate_compliance_batch falls back to the row-wise functions
+    np = None
 
 # Define severity thresholds
 severity_thresholds = {
@@ -57,48 +69,218 @@ def calculate_days_overdue(compliance_date):
     except ValueError:
         return None
 
-def extract_vulnerability_data(folder_path, output_file):
-    """Extracts CVE data from all CSV files in a folder and writes to a new CSV file."""
+def _parse_date_column(values, fmt):
+    """Parses each distinct date string once and returns a datetime64[D] array (NaT for bad dates)."""
+    uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    parsed = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[D]')
+    for idx, value in enumerate(uniques):
+        if not value:
+            continue
+        try:
+            parsed[idx] = np.datetime64(datetime.strptime(value, fmt).date(), 'D')
+        except ValueError:
+            pass  # Leave invalid dates as NaT
+    return parsed[inverse]
+
+def calculate_compliance_batch(discovered_dates, severities, today=None):
+    """Calculate Compliance Date and Days Overdue for a whole column of rows at once.
+
+    Equivalent to calling calculate_compliance_date and calculate_days_overdue on
+    every row: returns two lists (MM/DD/YYYY strings and day counts) holding None
+    wherever the row-wise functions would return None.
+    """
+    if today is None:
+        today = datetime.now()
+
+    if np is None:
+        compliance_dates = [calculate_compliance_date(d, s) for d, s in zip(discovered_dates, severities)]
+        return compliance_dates, [calculate_days_overdue(c) for c in compliance_dates]
+
+    count = len(discovered_dates)
+    compliance_dates = np.full(count, None, dtype=object)
+    days_overdue = np.full(count, None, dtype=object)
+    if count == 0:
+        return compliance_dates.tolist(), days_overdue.tolist()
+
+    fmt = "%m/%d/%Y"
+    discovered = _parse_date_column(discovered_dates, fmt)
+
+    # Map severity to threshold days through a lookup array (-1 for unknown severities)
+    severity_values, severity_codes = np.unique(np.asarray(severities, dtype=str), return_inverse=True)
+    lookup = np.array([severity_thresholds.get(value, -1) for value in severity_values], dtype=np.int64)
+    threshold_days = lookup[severity_codes]
+
+    valid = ~np.isnat(discovered) & (threshold_days >= 0)
+    compliance = discovered[valid] + threshold_days[valid].astype('timedelta64[D]')
+
+    # Format each distinct compliance date once
+    compliance_uniques, compliance_codes = np.unique(compliance, return_inverse=True)
+    formatted = np.array([value.astype(datetime).strftime(fmt) for value in compliance_uniques], dtype=object)
+    compliance_dates[valid] = formatted[compliance_codes]
+
+    today_day = np.datetime64(today.date(), 'D')
+    days_overdue[valid] = (today_day - compliance).astype(np.int64).tolist()
+
+    return compliance_dates.tolist(), days_overdue.tolist()
+
+# Column layout of the consolidated output file
+OUTPUT_HEADER = ['Environment','CVE', 'Severity', 'Type','Package','Published', 'Fix Date', 'Discovered', 'Compliance Date', 'Days Overdue']
+
+def extract_file_rows(folder_path, filename):
+    """Reads one environment CSV file and returns its rows in the output layout."""
+    file_path = os.path.join(folder_path, filename)
+
+    # Read the normalized columns from the columnar cache (built on first use)
+    with vuln_cache.load_columns(file_path) as columns:
+        rows = [list(row) for row in columns.iter_rows()]
+
+    # Calculate Compliance Date and Days Overdue for the whole file in one pass
+    compliance_dates, days_overdue = calculate_compliance_batch([row[7] for row in rows], [row[2] for row in rows])
+    for row, compliance_date, overdue in zip(rows, compliance_dates, days_overdue):
+        row.extend([compliance_date, overdue])
+
+    return rows
+
+def iter_file_rows(folder_path, filenames, workers=1):
+    """Yields (filename, rows) for each file, in the order given.
+
+    With workers > 1 the files are shared out across a process pool; executor.map
+    yields results in submission order, so the output stays deterministic.
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from zip(filenames, executor.map(extract_file_rows, repeat(folder_path), filenames))
+    else:
+        for filename in filenames:
+            yield filename, extract_file_rows(folder_path, filename)
+
+def file_digest(file_path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, mode='rb') as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """Loads the ingest manifest ({filename: {size, mtime_ns, sha256, segment}})."""
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, mode='r') as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        print(f"Ignoring unreadable manifest {manifest_path}; rebuilding all segments.")
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    """Writes the ingest manifest atomically."""
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, mode='w') as outfile:
+        json.dump(manifest, outfile, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def extract_vulnerability_data_incremental(folder_path, output_file, cache_dir, workers=1):
+    """Rebuilds the output file, re-parsing only new or changed input files.
+
+    Each input file's size, mtime and content hash are recorded in a manifest in
+    cache_dir together with a cached segment holding its normalized rows. A file
+    whose size and mtime are unchanged (or whose hash is unchanged after a touch)
+    is served from its segment. Segments leave out Days Overdue, which depends on
+    today's date and is recomputed while the combined output is assembled.
+    """
+    segment_dir = os.path.join(cache_dir, 'segments')
+    os.makedirs(segment_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    manifest = load_manifest(manifest_path)
+
+    filenames = sorted(filename for filename in os.listdir(folder_path) if filename.endswith('.csv'))
+
+    # Work out which files need re-parsing
+    stale = []
+    for filename in filenames:
+        stat = os.stat(os.path.join(folder_path, filename))
+        entry = manifest.get(filename)
+        if entry and os.path.exists(os.path.join(segment_dir, entry['segment'])):
+            if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            digest = file_digest(os.path.join(folder_path, filename))
+            if entry['sha256'] == digest:
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                continue
+        stale.append(filename)
+
+    # Re-parse new and changed files into their segments
+    for filename, rows in iter_file_rows(folder_path, stale, workers):
+        file_path = os.path.join(folder_path, filename)
+        stat = os.stat(file_path)
+        segment = hashlib.sha1(filename.encode('utf-8')).hexdigest() + '.csv'
+        with open(os.path.join(segment_dir, segment), mode='w', newline='') as segfile:
+            csv.writer(segfile).writerows(row[:-1] for row in rows)
+        manifest[filename] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_digest(file_path),
+            'segment': segment,
+        }
+
+    # Drop files that have disappeared from the folder
+    for filename in set(manifest) - set(filenames):
+        segment_path = os.path.join(segment_dir, manifest.pop(filename)['segment'])
+        if os.path.exists(segment_path):
+            os.remove(segment_path)
+
+    # Rebuild the combined output from the cached segments
+    overdue_by_date = {}
+    with open(output_file, mode='w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(OUTPUT_HEADER)
+        for filename in filenames:
+            with open(os.path.join(segment_dir, manifest[filename]['segment']), mode='r', newline='') as segfile:
+                for row in csv.reader(segfile):
+                    compliance_date = row[8]
+                    if compliance_date not in overdue_by_date:
+                        overdue_by_date[compliance_date] = calculate_days_overdue(compliance_date)
+                    row.append(overdue_by_date[compliance_date])
+                    writer.writerow(row)
+
+    save_manifest(manifest_path, manifest)
+    print(f"Re-parsed {len(stale)} of {len(filenames)} files.")
+    print(f"Data successfully extracted to {output_file}")
+
+def extract_vulnerability_data(folder_path, output_file, workers=1):
+    """Extracts CVE data from all CSV files in a folder and writes to a new CSV file.
+
+    Files are processed in file name order. With workers > 1 the files are shared
+    out across a process pool and the results are written back in the same order,
+    so the output is identical to a single-process run.
+    """
+    filenames = sorted(filename for filename in os.listdir(folder_path) if filename.endswith('.csv'))
+
     # Open the output CSV file in write mode, and write the headers
     with open(output_file, mode='w', newline='') as outfile:
     
         writer = csv.writer(outfile)
-        writer.writerow(['Environment','CVE', 'Severity', 'Type','Package','Published', 'Fix Date', 'Discovered', 'Compliance Date', 'Days Overdue'])
-
-        # Iterate over all CSV files in the given folder
-        for filename in os.listdir(folder_path):
-            if filename.endswith('.csv'):
-                filename1 = filename.split(" ")[0]
-                file_path = os.path.join(folder_path, filename)
-                
-                # Open each CSV file
-                with open(file_path, mode='r') as infile:
-                    reader = csv.DictReader(infile)
-                    
-                    # Process each row in the file
-                    for row in reader:
-                        cve = row.get('CVE', '').strip()
-                        severity = row.get('Severity', '').strip()
-                        type = row.get('Type', '').strip()
-                        published = row.get('Published', '').strip()
-                        fix_date = row.get('Fix Date', '').strip()
-                        discovered = row.get('Discovered', '').strip()
-                        #Package Name	Installed Version
-                        package = row.get('Package Name', '').strip() + " " +row.get('Installed Version', '').strip()
-
-                      
-                        # Calculate Compliance Date and Days Overdue
-                        compliance_date = calculate_compliance_date(discovered, severity)
-                        days_overdue = calculate_days_overdue(compliance_date)
-
-                        # Write the extracted and calculated data to the new CSV file
-                        writer.writerow([filename1, cve, severity, type, package, published, fix_date, discovered, compliance_date,  days_overdue])
+        writer.writerow(OUTPUT_HEADER)
+
+        for _, rows in iter_file_rows(folder_path, filenames, workers):
+            writer.writerows(rows)
 
     print(f"Data successfully extracted to {output_file}")
 
-# Specify the folder path where your CSV files are located
-folder_path = '_Vuln'  # Replace with actual folder path
-output_file = '_charts/all_environments.csv'  # Output CSV file path
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract CVE data from Twistlock environment CSV files.")
+    parser.add_argument('--folder', default='_Vuln', help="Folder containing the environment CSV files")
+    parser.add_argument('--output', default='_charts/all_environments.csv', help="Output CSV file path")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument('--incremental', action='store_true', help="Only re-parse new or changed files")
+    parser.add_argument('--cache-dir', help="Manifest and segment cache for --incremental "
+                                            "(default: .ingest_cache next to the output file)")
+    args = parser.parse_args()
 
-# Run the function
-extract_vulnerability_data(folder_path, output_file)
+    # Run the function
+    if args.incremental:
+        cache_dir = args.cache_dir or os.path.join(os.path.dirname(args.output), '.ingest_cache')
+        extract_vulnerability_data_incremental(args.folder, args.output, cache_dir, workers=args.workers)
+    else:
+        extract_vulnerability_data(args.folder, args.output, workers=args.workers)
@@ -0,0 +1,193 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from tl2csv import iter_json_array
+
+# Content-addressed history of downloaded Twistlock scan reports.
+#
+# Every host/image record is serialized canonically (sorted keys, compact separators),
+# hashed with SHA-256 and stored once, gzip-compressed, under objects/<2 hex>/<rest>.json.gz.
+# Each run is a manifest under runs/ listing the hashes of its records in report order.
+# A record that did not change since an earlier run is already in objects/, so it costs
+# no extra disk or write I/O; any run can be rebuilt into a full report on demand.
+#
+# Manifest layout: a JSON metadata line, then one record hash per line.
+
+SNAPSHOT_DIR = os.environ.get('TL_SNAPSHOT_DIR', 'scan_snapshots')
+
+def object_path(root, digest):
+    return os.path.join(root, 'objects', digest[:2], digest[2:] + '.json.gz')
+
+def manifest_path(root, run_id):
+    return os.path.join(root, 'runs', run_id + '.manifest')
+
+def _atomic_write(path, data):
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def store_record(root, record):
+    """Stores a record if its content is not already present. Returns (digest, True if newly written)."""
+    data = json.dumps(record, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+    path = object_path(root, digest)
+    if os.path.exists(path):
+        return digest, False
+    _atomic_write(path, gzip.compress(data, mtime=0))
+    return digest, True
+
+def load_record(root, digest):
+    """Returns the stored record for a hash."""
+    with gzip.open(object_path(root, digest), 'rb') as f:
+        return json.loads(f.read())
+
+class SnapshotWriter:
+    """
+    Records one run: add() each record as it is downloaded, then commit() to publish the
+    manifest. A run that is never committed leaves no manifest behind.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, run_id=None, source=None):
+        self.root = root
+        self.run_id = run_id or self._new_run_id()
+        self.source = source
+        self.records = 0
+        self.new_objects = 0
+        self._digests = tempfile.TemporaryFile(mode='w+t', encoding='ascii')
+
+    def _new_run_id(self):
+        run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = 1
+        while os.path.exists(manifest_path(self.root, run_id)):
+            suffix += 1
+            run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{suffix}"
+        return run_id
+
+    def add(self, record):
+        digest, written = store_record(self.root, record)
+        self._digests.write(digest + "\n")
+        self.records += 1
+        self.new_objects += written
+        return digest
+
+    def commit(self):
+        """Writes the run's manifest and returns the run ID."""
+        metadata = {
+            'run_id': self.run_id,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'source': self.source,
+            'records': self.records,
+        }
+        path = manifest_path(self.root, self.run_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.part'
+        self._digests.seek(0)
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(metadata) + "\n")
+            for line in self._digests:
+                f.write(line)
+        os.replace(tmp_path, path)
+        self._digests.close()
+        return self.run_id
+
+    def abort(self):
+        self._digests.close()
+
+def snapshot_report(report_file, root=SNAPSHOT_DIR, run_id=None):
+    """
+    Streams a JSON report (gzip-compressed if it ends with '.gz') into the store as a new run.
+    Returns (run ID, records, newly stored records).
+    """
+    writer = SnapshotWriter(root, run_id, source=os.path.basename(report_file))
+    opener = gzip.open if report_file.endswith('.gz') else open
+    try:
+        with opener(report_file, 'rt', encoding='utf-8') as f:
+            for record in iter_json_array(f):
+                writer.add(record)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.commit(), writer.records, writer.new_objects
+
+def read_manifest(root, run_id):
+    """Returns (metadata, iterator of record hashes) for a run."""
+    f = open(manifest_path(root, run_id), encoding='utf-8')
+    metadata = json.loads(f.readline())
+
+    def digests():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+    return metadata, digests()
+
+def list_runs(root=SNAPSHOT_DIR):
+    """Returns the metadata of every committed run, oldest first."""
+    runs_dir = os.path.join(root, 'runs')
+    if not os.path.isdir(runs_dir):
+        return []
+    paths = [os.path.join(runs_dir, filename) for filename in os.listdir(runs_dir) if filename.endswith('.manifest')]
+    runs = []
+    for path in sorted(paths, key=lambda path: (os.stat(path).st_mtime_ns, path)):
+        with open(path, encoding='utf-8') as f:
+            runs.append(json.loads(f.readline()))
+    return runs
+
+def rebuild_run(run_id, output_file, root=SNAPSHOT_DIR):
+    """
+    Rebuilds a run's report as a JSON array (gzip-compressed if output_file ends with '.gz'),
+    in the layout tlapi.py downloads. Returns the record count.
+    """
+    _, digests = read_manifest(root, run_id)
+    tmp_path = output_file + '.part'
+    opener = gzip.open if output_file.endswith('.gz') else open
+    record_count = 0
+    try:
+        with opener(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write("[")
+            for digest in digests:
+                if record_count:
+                    f.write(",\n")
+                f.write(json.dumps(load_record(root, digest)))
+                record_count += 1
+            f.write("]\n")
+        os.replace(tmp_path, output_file)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return record_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed history of Twistlock scan reports.")
+    parser.add_argument('--root', default=SNAPSHOT_DIR, help=f"Snapshot store folder (default: {SNAPSHOT_DIR})")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add_parser = subparsers.add_parser('add', help="Record a downloaded report as a new run")
+    add_parser.add_argument('report', help="JSON report (.gz supported)")
+    subparsers.add_parser('list', help="List recorded runs")
+    rebuild_parser = subparsers.add_parser('rebuild', help="Rebuild a run's report")
+    rebuild_parser.add_argument('run_id')
+    rebuild_parser.add_argument('output', help="Output JSON file (.gz to compress)")
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        run_id, records, new_objects = snapshot_report(args.report, args.root)
+        print(f"Run {run_id}: {records} records, {new_objects} new.")
+    elif args.command == 'list':
+        for run in list_runs(args.root):
+            print(f"{run['run_id']}  {run['created']}  {run['records']:>8} records  {run.get('source') or ''}")
+    else:
+        record_count = rebuild_run(args.run_id, args.output, args.root)
+        print(f"Rebuilt run {args.run_id} ({record_count} records) to {args.output}.")
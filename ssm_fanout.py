@@ -0,0 +1,269 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+except ImportError:  # stub clients raise the built-in connection errors
+    BotocoreConnectionError = HTTPClientError = ConnectionError
+
+# Batched, concurrent SSM Run Command fan-out shared by copy_file.py and delete_file.py.
+#
+# Instances are grouped by operating system (each group runs the same command) and
+# sent in batches of up to MAX_INSTANCES_PER_COMMAND instance IDs per send_command
+# call, with up to max_concurrency batches in flight at once. Throttled calls are
+# retried with exponential backoff and jitter. Completion is tracked in bulk with
+# list_command_invocations per CommandId (see CompletionTracker). The SSM client is
+# passed in, so a stub with the same send_command/list_command_invocations/cancel_command
+# methods can stand in for boto3.
+
+# send_command accepts at most 50 instance IDs per call
+MAX_INSTANCES_PER_COMMAND = 50
+DEFAULT_CONCURRENCY = 8
+
+# Completion polling: first delay, longest delay and overall limit, in seconds
+POLL_INITIAL_DELAY = 1
+POLL_MAX_DELAY = 30
+COMMAND_TIMEOUT = 600
+
+# Invocation statuses that will not change any more
+FINAL_STATUSES = {'Success', 'Failed', 'Cancelled', 'TimedOut'}
+
+THROTTLING_ERRORS = {'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'RequestLimitExceeded'}
+
+# Connection and endpoint errors raised before a response arrives (no AWS error code)
+CONNECTION_ERRORS = (ConnectionError, TimeoutError, BotocoreConnectionError, HTTPClientError)
+
+def error_code(error):
+    """Returns the AWS error code of a botocore ClientError (or a stub raising the same shape), else None."""
+    return (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+
+def call_with_backoff(func, max_attempts=6, base_delay=0.5, max_delay=20, sleep=time.sleep, **kwargs):
+    """Calls func(**kwargs), retrying throttling errors with exponential backoff and full jitter."""
+    for attempt in range(max_attempts):
+        try:
+            return func(**kwargs)
+        except Exception as e:
+            if error_code(e) not in THROTTLING_ERRORS or attempt == max_attempts - 1:
+                raise
+            sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+def plan_batches(instances, build_command, batch_size=MAX_INSTANCES_PER_COMMAND):
+    """
+    Groups instances ({'InstanceId', 'OperatingSystem'} dicts) by operating system and splits
+    each group into batches. build_command(platform_type) returns the shell command for that
+    platform, or None if the platform is not supported. An instance ID listed more than once
+    is planned once, at its first position and with its first operating system.
+    Returns (batches, unsupported instances); each batch is a dict with Platform, Command and InstanceIds.
+    """
+    groups = {}
+    planned = set()
+    for instance in instances:
+        if instance['InstanceId'] in planned:
+            continue
+        planned.add(instance['InstanceId'])
+        groups.setdefault(instance['OperatingSystem'], []).append(instance['InstanceId'])
+
+    batches = []
+    unsupported = []
+    for platform_type, instance_ids in groups.items():
+        command = build_command(platform_type)
+        if command is None:
+            unsupported.extend({'InstanceId': instance_id, 'OperatingSystem': platform_type} for instance_id in instance_ids)
+            continue
+        for start in range(0, len(instance_ids), batch_size):
+            batches.append({
+                'Platform': platform_type,
+                'Command': command,
+                'InstanceIds': instance_ids[start:start + batch_size],
+            })
+    return batches, unsupported
+
+def send_batch(ssm_client, batch, document_name, sleep=time.sleep, clock=time.monotonic):
+    """Sends one batch; sets its CommandId and SentAt, or its Error if the call failed."""
+    batch['SentAt'] = clock()
+    try:
+        response = call_with_backoff(
+            ssm_client.send_command, sleep=sleep,
+            InstanceIds=batch['InstanceIds'],
+            DocumentName=document_name,
+            Parameters={"commands": [batch['Command']]},
+        )
+        batch['CommandId'] = response['Command']['CommandId']
+    except Exception as e:
+        batch['CommandId'] = None
+        batch['Error'] = str(e)
+    return batch
+
+class CompletionTracker:
+    """
+    Waits for sent commands to reach a final status on every instance.
+
+    Each round makes one paginated list_command_invocations(Details=True) call per
+    CommandId still in progress, rather than one call per instance. Rounds are spaced
+    with jittered backoff: the delay halves after a round in which instances finished
+    and doubles after a round with no progress, between initial_delay and max_delay.
+    Invocations that do not exist yet (SSM registers them shortly after send_command)
+    are treated as pending, and rounds that are throttled or hit a connection or endpoint
+    error just back off; any other error fails the command's pending instances at once.
+    Elapsed is taken from the invocation's own RequestedDateTime and ResponseFinishDateTime
+    when SSM reports them. Instances with no final status after timeout seconds are
+    cancelled with cancel_command and reported as TimedOut.
+    """
+
+    def __init__(self, ssm_client, initial_delay=POLL_INITIAL_DELAY, max_delay=POLL_MAX_DELAY,
+                 timeout=COMMAND_TIMEOUT, sleep=time.sleep, clock=time.monotonic):
+        self.ssm_client = ssm_client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.sleep = sleep
+        self.clock = clock
+        self.api_calls = 0  # list_command_invocations requests made
+        self.cancel_calls = 0  # cancel_command requests made
+        self._pending = {}  # CommandId -> {InstanceId: sent at}
+        self._results = {}
+
+    def add(self, command_id, instance_ids, sent_at=None):
+        sent_at = self.clock() if sent_at is None else sent_at
+        self._pending.setdefault(command_id, {}).update(dict.fromkeys(instance_ids, sent_at))
+
+    def _iter_invocations(self, command_id):
+        kwargs = {'CommandId': command_id, 'Details': True}
+        while True:
+            self.api_calls += 1
+            response = call_with_backoff(self.ssm_client.list_command_invocations, max_attempts=3,
+                                         sleep=self.sleep, **kwargs)
+            yield from response.get('CommandInvocations', [])
+            if not response.get('NextToken'):
+                return
+            kwargs['NextToken'] = response['NextToken']
+
+    def _finish(self, command_id, instance_id, status, output, error, now, elapsed=None):
+        sent_at = self._pending[command_id].pop(instance_id)
+        self._results[instance_id] = {'Status': status, 'Output': output, 'Error': error,
+                                      'Elapsed': now - sent_at if elapsed is None else elapsed}
+
+    @staticmethod
+    def _invocation_elapsed(invocation):
+        """Seconds from RequestedDateTime to the last plugin's ResponseFinishDateTime, or None if not reported."""
+        requested = invocation.get('RequestedDateTime')
+        finished = [plugin['ResponseFinishDateTime'] for plugin in invocation.get('CommandPlugins', [])
+                    if plugin.get('ResponseFinishDateTime')]
+        if not requested or not finished:
+            return None
+        try:
+            return max(0.0, (max(finished) - requested).total_seconds())
+        except TypeError:  # not datetimes
+            return None
+
+    def _cancel(self, command_id, instance_ids):
+        """Asks SSM to stop a command on instances that timed out. Returns an error message, or '' on success."""
+        self.cancel_calls += 1
+        try:
+            call_with_backoff(self.ssm_client.cancel_command, max_attempts=3, sleep=self.sleep,
+                              CommandId=command_id, InstanceIds=instance_ids)
+        except Exception as e:
+            return f"; cancel_command failed: {e}"
+        return ''
+
+    def poll_once(self):
+        """Checks every command still in progress once. Returns the number of instances that finished."""
+        finished = 0
+        for command_id, pending in list(self._pending.items()):
+            try:
+                for invocation in self._iter_invocations(command_id):
+                    instance_id = invocation.get('InstanceId')
+                    status = invocation.get('Status')
+                    if instance_id not in pending or status not in FINAL_STATUSES:
+                        continue
+                    plugin_output = ''.join(plugin.get('Output') or '' for plugin in invocation.get('CommandPlugins', []))
+                    error = '' if status == 'Success' else (plugin_output or invocation.get('StatusDetails') or status)
+                    self._finish(command_id, instance_id, status, plugin_output, error, self.clock(),
+                                 self._invocation_elapsed(invocation))
+                    finished += 1
+            except Exception as e:
+                # Throttling, not-yet-registered invocations and connection or endpoint errors
+                # are retried next round; anything else (other API errors, parameter
+                # validation, local bugs) fails the command straight away
+                code = error_code(e)
+                if not (code in THROTTLING_ERRORS or code == 'InvocationDoesNotExist'
+                        or (code is None and isinstance(e, CONNECTION_ERRORS))):
+                    now = self.clock()
+                    for instance_id in list(pending):
+                        self._finish(command_id, instance_id, 'Failed', '', str(e), now)
+                        finished += 1
+            if not pending:
+                del self._pending[command_id]
+        return finished
+
+    def wait(self):
+        """Polls until every instance is final or the timeout passes. Returns {InstanceId: result}."""
+        deadline = self.clock() + self.timeout
+        delay = self.initial_delay
+        while self._pending:
+            # Jittered wait: between half and all of the current delay
+            self.sleep(delay / 2 + random.uniform(0, delay / 2))
+            if self.poll_once():
+                delay = max(self.initial_delay, delay / 2)
+            else:
+                delay = min(self.max_delay, delay * 2)
+
+            if self._pending and self.clock() >= deadline:
+                # Stop the command where it is still running, then report it as timed out
+                for command_id, pending in list(self._pending.items()):
+                    cancel_error = self._cancel(command_id, list(pending))
+                    now = self.clock()
+                    for instance_id in list(pending):
+                        self._finish(command_id, instance_id, 'TimedOut', '',
+                                     f"No final status after {self.timeout}s{cancel_error}", now)
+                self._pending.clear()
+        return self._results
+
+def run_command_fanout(ssm_client, instances, build_command, document_name="AWS-RunShellScript",
+                       batch_size=MAX_INSTANCES_PER_COMMAND, max_concurrency=DEFAULT_CONCURRENCY,
+                       timeout=COMMAND_TIMEOUT, sleep=time.sleep, clock=time.monotonic):
+    """
+    Runs a per-platform command on every instance and waits for it to finish.
+    Returns (results, api_calls): one result dict per distinct instance ID, in input order, with InstanceId,
+    OperatingSystem, CommandId, Status, Output, Error and Elapsed (seconds from request to
+    final status, or None), and the number of SSM requests made per API, excluding throttled retries.
+    """
+    batches, unsupported = plan_batches(instances, build_command, batch_size)
+
+    results = {}
+    for instance in unsupported:
+        results[instance['InstanceId']] = dict(instance, CommandId=None, Status='Failed', Output='', Elapsed=None,
+                                               Error=f"Unsupported operating system '{instance['OperatingSystem']}'")
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        list(executor.map(lambda batch: send_batch(ssm_client, batch, document_name, sleep, clock), batches))
+
+    tracker = CompletionTracker(ssm_client, timeout=timeout, sleep=sleep, clock=clock)
+    for batch in batches:
+        for instance_id in batch['InstanceIds']:
+            results[instance_id] = {'InstanceId': instance_id, 'OperatingSystem': batch['Platform'],
+                                    'CommandId': batch['CommandId'], 'Status': 'Failed', 'Output': '',
+                                    'Error': batch.get('Error', ''), 'Elapsed': None}
+        if batch['CommandId']:
+            tracker.add(batch['CommandId'], batch['InstanceIds'], batch['SentAt'])
+
+    # Wait for every sent command to finish and record each instance's final status
+    for instance_id, final in tracker.wait().items():
+        results[instance_id].update(final)
+
+    api_calls = {'send_command': len(batches), 'list_command_invocations': tracker.api_calls}
+    if tracker.cancel_calls:
+        api_calls['cancel_command'] = tracker.cancel_calls
+    return [results[instance_id] for instance_id in dict.fromkeys(instance['InstanceId'] for instance in instances)], api_calls
+
+def describe_api_calls(api_calls, instance_count):
+    """Returns a one-line summary of the SSM requests made for a fan-out."""
+    total = sum(api_calls.values())
+    per_instance = total / instance_count if instance_count else 0
+    details = ', '.join(f"{count} {name}" for name, count in api_calls.items())
+    return f"{total} SSM API calls for {instance_count} WorkSpaces ({per_instance:.2f} per WorkSpace: {details})"
+
+def describe_elapsed(result):
+    """Returns ' (N.Ns)' for a result with a time-to-complete, else an empty string."""
+    return f" ({result['Elapsed']:.1f}s)" if result.get('Elapsed') is not None else ''
@@ -1,22 +1,63 @@
-from flask import Flask, jsonify, request
-import requests
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from flask import Flask, Response, jsonify, request
+
+import cve_cache
+import cve_offline
 
 app = Flask(__name__)
 
+# In-memory LRU of parsed results; size and TTL (seconds) can be overridden from the environment
+CACHE_MAX_ENTRIES = int(os.environ.get('SCOUT_CACHE_SIZE', 4096))
+CACHE_TTL = int(os.environ.get('SCOUT_CACHE_TTL', 3600))
+
+# POST /cve/batch limits: IDs accepted per request and concurrent upstream fetches per request
+app.config['BATCH_MAX_CVES'] = int(os.environ.get('SCOUT_BATCH_MAX_CVES', 500))
+app.config['BATCH_WORKERS'] = int(os.environ.get('SCOUT_BATCH_WORKERS', 16))
+
+_cache = OrderedDict()  # cve_id -> (expires at, result)
+_in_flight = {}  # cve_id -> Future shared by concurrent requests for the same CVE
+_cache_lock = threading.Lock()
+_metrics = {
+    'cache_hits': 0,
+    'cache_misses': 0,
+    'coalesced_requests': 0,
+    'upstream_fetches': 0,
+    'upstream_errors': 0,
+    'upstream_latency_seconds_total': 0.0,
+    'upstream_latency_seconds_max': 0.0
+}
+
 # Function to fetch CVE data from the MITRE CVE API
 def fetch_cve_data(cve_id):
     """
     Function to fetch CVE data from the MITRE CVE API and return a JSON response.
     """
-    url = f"https://cveawg.mitre.org/api/cve/{cve_id}"
-    
     try:
-        # Make a GET request to the API
-        response = requests.get(url)
+        # Answer from the offline CVE database when it has the record
+        fields = cve_offline.lookup_cve(cve_id)
+        if fields is not None:
+            # Same result as the online path, including when the record has no CVSS v3.x metrics
+            if fields[2] == 'N/A':
+                return {"error": f"No CVSS v3.x data found for {cve_id}"}
+            return {
+                "CVE_ID": cve_id,
+                "Base_Score": fields[2],
+                "Confidentiality_Impact": fields[10],
+                "Integrity_Impact": fields[11],
+                "Availability_Impact": fields[12]
+            }
+
+        # Fetch the record through the local cache (only hits the API when missing or stale)
+        status_code, cve_data = cve_cache.get_cve_json(cve_id)
         
         # Check if the request was successful
-        if response.status_code == 200:
-            cve_data = response.json()
+        if status_code == 200:
             # Extract CVSS v3.x metrics
             if 'impact' in cve_data and 'cvssV3' in cve_data['impact']:
                 cvss_v3 = cve_data['impact']['cvssV3']
@@ -35,22 +76,144 @@ def fetch_cve_data(cve_id):
             else:
                 return {"error": f"No CVSS v3.x data found for {cve_id}"}
         else:
-            return {"error": f"Failed to fetch data for {cve_id}, HTTP Status Code: {response.status_code}"}
+            return {"error": f"Failed to fetch data for {cve_id}, HTTP Status Code: {status_code}"}
     except Exception as e:
         return {"error": str(e)}
 
+# Helper to read a fresh LRU entry; the caller must hold _cache_lock
+def _cached_result(cve_id):
+    entry = _cache.get(cve_id)
+    if entry and entry[0] > time.monotonic():
+        _cache.move_to_end(cve_id)
+        _metrics['cache_hits'] += 1
+        return entry[1]
+    return None
+
+# Function to serve CVE data through the LRU with single-flight coalescing
+def get_cve_info(cve_id):
+    """
+    Returns fetch_cve_data(cve_id), served from the in-memory LRU while fresh.
+    Concurrent misses for the same CVE share one upstream fetch. Error results are not cached.
+    """
+    with _cache_lock:
+        cached = _cached_result(cve_id)
+        if cached is not None:
+            return cached
+
+        future = _in_flight.get(cve_id)
+        leader = future is None
+        if leader:
+            future = _in_flight[cve_id] = Future()
+            _metrics['cache_misses'] += 1
+        else:
+            _metrics['coalesced_requests'] += 1
+
+    # Followers wait for the leader's fetch
+    if not leader:
+        return future.result()
+
+    try:
+        started = time.monotonic()
+        result = fetch_cve_data(cve_id)
+        latency = time.monotonic() - started
+
+        with _cache_lock:
+            _metrics['upstream_fetches'] += 1
+            _metrics['upstream_latency_seconds_total'] += latency
+            _metrics['upstream_latency_seconds_max'] = max(_metrics['upstream_latency_seconds_max'], latency)
+            if 'error' in result:
+                _metrics['upstream_errors'] += 1
+            else:
+                _cache[cve_id] = (time.monotonic() + CACHE_TTL, result)
+                _cache.move_to_end(cve_id)
+                while len(_cache) > CACHE_MAX_ENTRIES:
+                    _cache.popitem(last=False)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            _in_flight.pop(cve_id, None)
+
 # API route to fetch CVE data
 @app.route('/cve/<cve_id>', methods=['GET'])
 def get_cve_data(cve_id):
     """
     API endpoint to fetch CVE data based on the CVE ID provided in the URL.
     """
-    # Call the fetch_cve_data function to get the data
-    cve_info = fetch_cve_data(cve_id)
+    # Get the data through the in-memory cache
+    cve_info = get_cve_info(cve_id)
     
     # Return the data as a JSON response
     return jsonify(cve_info)
 
+# API route to fetch many CVEs in one request
+@app.route('/cve/batch', methods=['POST'])
+def get_cve_batch():
+    """
+    API endpoint accepting a JSON list of CVE IDs (or {"cve_ids": [...]}) and streaming one
+    NDJSON result line per CVE. Cached results are sent first; misses are fetched
+    concurrently and each line is sent as soon as its fetch completes.
+    """
+    payload = request.get_json(silent=True)
+    cve_ids = payload.get('cve_ids') if isinstance(payload, dict) else payload
+    if not isinstance(cve_ids, list) or not all(isinstance(cve_id, str) for cve_id in cve_ids):
+        return jsonify({"error": "Request body must be a JSON list of CVE IDs or {\"cve_ids\": [...]}"}), 400
+
+    cve_ids = list(dict.fromkeys(cve_id.strip() for cve_id in cve_ids if cve_id.strip()))
+    max_cves = app.config['BATCH_MAX_CVES']
+    if len(cve_ids) > max_cves:
+        return jsonify({"error": f"Too many CVE IDs: {len(cve_ids)} (limit {max_cves})"}), 413
+
+    def result_line(cve_id, result):
+        return json.dumps({"CVE_ID": cve_id, **result}) + "\n"
+
+    def generate():
+        # Send cache hits straight away
+        misses = []
+        for cve_id in cve_ids:
+            with _cache_lock:
+                cached = _cached_result(cve_id)
+            if cached is None:
+                misses.append(cve_id)
+            else:
+                yield result_line(cve_id, cached)
+
+        if not misses:
+            return
+
+        # Fetch the misses concurrently and stream each as it completes
+        executor = ThreadPoolExecutor(max_workers=min(app.config['BATCH_WORKERS'], len(misses)))
+        try:
+            futures = {executor.submit(get_cve_info, cve_id): cve_id for cve_id in misses}
+            for future in as_completed(futures):
+                cve_id = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": str(e)}
+                yield result_line(cve_id, result)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+# API route exposing cache and upstream counters
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    API endpoint reporting cache hit/miss counts and upstream fetch latency.
+    """
+    with _cache_lock:
+        metrics = dict(_metrics)
+        metrics['cache_entries'] = len(_cache)
+        metrics['in_flight'] = len(_in_flight)
+    fetches = metrics['upstream_fetches']
+    metrics['upstream_latency_seconds_avg'] = metrics['upstream_latency_seconds_total'] / fetches if fetches else 0.0
+    return jsonify(metrics)
+
 # Run the Flask application
 if __name__ == '__main__':
     app.run(debug=True)
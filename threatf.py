@@ -2,6 +2,8 @@ import os
 import csv
 from tkinter import filedialog, Tk, Button
 
+import vuln_cache
+
 # Function to browse and select a folder
 def browse_folder():
     folder_selected = filedialog.askdirectory()
@@ -17,12 +19,10 @@ def process_twistlock_files(folder_path):
     for file_name in os.listdir(folder_path):
         if file_name.endswith(".csv"):  # Assuming CSV files
             file_path = os.path.join(folder_path, file_name)
-            # Read the CSV file to extract CVEs
-            with open(file_path, mode='r') as file:
-                reader = csv.DictReader(file)
-                if 'CVE' in reader.fieldnames:  # Check if 'CVE' column exists
-                    for row in reader:
-                        unique_cves.add(row['CVE'])
+            # Read the distinct CVEs straight from the columnar cache's dictionary
+            with vuln_cache.load_columns(file_path) as columns:
+                if 'CVE' in columns.source_fields:  # Check if 'CVE' column exists
+                    unique_cves.update(columns.values('CVE'))
     
     # Use threat_form.csv as a template to store CVE data
     collect_threat_info(unique_cves)
@@ -97,4 +97,4 @@ select_button.pack(pady=20)
 root.mainloop()
 
 #CVE ID,CVSS Score,Severity,Asset Name/ID,Asset Criticality,Attack Vector,Exploit Available (Y/N),Potential Impact,Business Impact,Patch Available (Y/N),Patch Status (Applied/Not Applied),Mitigating Controls,Detection Mechanism,Date Discovered,Date Last Exploited,Business Risk,Compliance Impact,MITRE ATT&CK Tactic,Comments
-,,,,,,,,,,,,,,,,,,
\ No newline at end of file
+#,,,,,,,,,,,,,,,,,,
@@ -0,0 +1,200 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timezone
+
+# Converts a Twistlock JSON scan report (as saved by tlapi.py or tlsync.py) into the
+# per-environment CSVs read by delta2.py, 1_sort.py and pf.
+#
+# The report is a JSON array of host/image records. It is read in chunks and decoded
+# one record at a time with JSONDecoder.raw_decode, and every vulnerability row is
+# written out as soon as its record is decoded, so memory use is bounded by the
+# largest single record rather than by the size of the report.
+
+CSV_HEADER = ['CVE', 'Severity', 'Type', 'Package Name', 'Installed Version', 'Published', 'Fix Date', 'Discovered']
+
+# Environment used for records that belong to no collection
+DEFAULT_ENVIRONMENT = 'Unassigned'
+
+CHUNK_SIZE = 1 << 20
+
+# Largest single record (in characters) the reader will buffer before giving up
+MAX_RECORD_SIZE = 256 << 20
+
+# Characters that can continue a JSON number
+NUMBER_CHARS = frozenset('0123456789+-.eE')
+
+WHITESPACE = ' \t\r\n'
+
+def iter_json_array(fileobj, chunk_size=CHUNK_SIZE, max_record_size=MAX_RECORD_SIZE):
+    """
+    Yields the elements of a top-level JSON array from a text file object, one at a time.
+    Raises ValueError for anything json.load would reject: an empty input, missing,
+    leading, doubled or trailing commas, or data after the closing bracket.
+    """
+    decoder = json.JSONDecoder()
+    buffer = fileobj.read(chunk_size)
+    pos = 0
+    eof = not buffer
+
+    def skip_whitespace():
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            buffer, pos = fileobj.read(chunk_size), 0
+            eof = not buffer
+
+    def next_char():
+        skip_whitespace()
+        if pos == len(buffer):
+            raise ValueError("Unexpected end of report")
+        return buffer[pos]
+
+    skip_whitespace()
+    if pos == len(buffer):
+        raise ValueError("Report is empty")
+    if buffer[pos] != '[':
+        raise ValueError("Report is not a JSON array")
+    pos += 1
+
+    if next_char() == ']':
+        pos += 1
+    else:
+        read_size = chunk_size
+        while True:
+            if next_char() in ',]':
+                raise ValueError(f"Expected a value at {buffer[pos]!r} in report")
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # A number cut off at the buffer edge ("12" of "1234", "1." of "1.5") decodes as
+                # a shorter number; only accept it once a delimiter follows. Other values end
+                # on a closing delimiter and cannot be cut short
+                complete = (eof or not isinstance(element, (int, float))
+                            or (end < len(buffer) and buffer[end] not in NUMBER_CHARS))
+            except json.JSONDecodeError as e:
+                # Truncation only fails near the end of the buffer (or at an unterminated
+                # string), so an error earlier than that is malformed input
+                if eof or (e.pos < len(buffer) - 16 and not e.msg.startswith('Unterminated string')):
+                    raise
+                complete = False
+            if not complete:
+                # Read more and retry, doubling the read each time so a large record is
+                # not re-decoded once per chunk, up to max_record_size
+                if len(buffer) - pos >= max_record_size:
+                    raise ValueError(f"Report element exceeds {max_record_size} characters")
+                read_size = min(read_size * 2, max_record_size)
+                more = fileobj.read(read_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            read_size = chunk_size
+            yield element
+            pos = end
+
+            # Exactly one comma between elements
+            char = next_char()
+            if char == ']':
+                pos += 1
+                break
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' at {char!r} in report")
+            pos += 1
+
+    skip_whitespace()
+    if pos < len(buffer):
+        raise ValueError("Unexpected data after the end of the report")
+
+def format_date(value, fmt):
+    """Formats an epoch-seconds or ISO 8601 timestamp; empty for missing or zero values."""
+    if not value:
+        return ''
+    try:
+        if isinstance(value, (int, float)):
+            moment = datetime.fromtimestamp(value, tz=timezone.utc)
+        else:
+            moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, OverflowError, OSError):
+        return ''
+    return moment.strftime(fmt)
+
+def record_environment(record):
+    """Returns the environment of a host/image record: its first collection other than 'All'."""
+    for collection in record.get('collections') or []:
+        if collection and collection != 'All':
+            return collection
+    return DEFAULT_ENVIRONMENT
+
+def vulnerability_rows(record):
+    """Yields a CSV row (CSV_HEADER order) for each vulnerability in a host/image record."""
+    for vuln in record.get('vulnerabilities') or []:
+        yield [
+            vuln.get('cve', ''),
+            (vuln.get('severity') or '').capitalize(),
+            vuln.get('type') or vuln.get('packageType') or '',
+            vuln.get('packageName', ''),
+            vuln.get('packageVersion', ''),
+            format_date(vuln.get('published'), '%m/%d/%Y'),
+            format_date(vuln.get('fixDate'), '%Y-%m-%d'),
+            format_date(vuln.get('discovered'), '%m/%d/%Y'),
+        ]
+
+def environment_filename(environment):
+    """Returns the CSV file name for an environment; delta2 reads the environment up to the first space."""
+    return re.sub(r'[^\w.-]+', '_', environment) + " vulnerabilities.csv"
+
+def convert_report(report_file, output_folder, environment=None):
+    """
+    Streams a JSON scan report (gzip-compressed if it ends with '.gz') into one CSV per
+    environment in output_folder. If environment is given, every record goes to that
+    environment's file instead of its collection's. Environments whose names map to the
+    same file name (e.g. "Prod East" and "Prod/East") are written to one file.
+    Returns {environment: rows written}.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    opener = gzip.open if report_file.endswith('.gz') else open
+    outputs = {}  # output path -> (file, writer)
+    row_counts = {}
+
+    try:
+        with opener(report_file, 'rt', encoding='utf-8') as infile:
+            for record in iter_json_array(infile):
+                record_env = environment or record_environment(record)
+                # Environments whose names sanitize to the same file name share that file
+                path = os.path.join(output_folder, environment_filename(record_env))
+                for row in vulnerability_rows(record):
+                    if path not in outputs:
+                        outfile = open(path + '.part', mode='w', newline='', encoding='utf-8')
+                        writer = csv.writer(outfile)
+                        writer.writerow(CSV_HEADER)
+                        outputs[path] = (outfile, writer)
+                    outputs[path][1].writerow(row)
+                    row_counts[record_env] = row_counts.get(record_env, 0) + 1
+    except Exception:
+        for path, (outfile, _) in outputs.items():
+            outfile.close()
+            os.remove(path + '.part')
+        raise
+
+    for path, (outfile, _) in outputs.items():
+        outfile.close()
+        os.replace(path + '.part', path)
+
+    return row_counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a Twistlock JSON scan report into per-environment CSVs.")
+    parser.add_argument('report', help="JSON report from tlapi.py or tlsync.py (.gz supported)")
+    parser.add_argument('--output', default='_Vuln', help="Folder for the CSV files (default: _Vuln)")
+    parser.add_argument('--environment', help="Write every record to this environment instead of its collection")
+    args = parser.parse_args()
+
+    row_counts = convert_report(args.report, args.output, args.environment)
+    for environment, rows in sorted(row_counts.items()):
+        print(f"{environment}: {rows} rows -> {os.path.join(args.output, environment_filename(environment))}")
+    print(f"Wrote {sum(row_counts.values())} rows for {len(row_counts)} environments.")
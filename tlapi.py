@@ -1,8 +1,243 @@
+import gzip
 import http.client
 import json
+import os
+import queue
 import ssl
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
-def download_twistlock_vulnerability_scans(base_url, username, password, output_file='vulnerability_report.json'):
+import scan_snapshots
+
+# Number of records requested per page, and the most a console returns per page
+# (recent consoles cap limit at 50; larger page sizes are clamped to this)
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 50
+
+def open_connection(base_url):
+    """
+    Returns an HTTP(S) connection to the console, or None if the URL has no http:// or https:// scheme.
+    """
+    # Disable SSL certificate verification (optional: only if required)
+    context = ssl._create_unverified_context()
+
+    # Extract the hostname and determine if it's an HTTPS connection
+    if base_url.startswith("https://"):
+        hostname = base_url.replace("https://", "")
+        return http.client.HTTPSConnection(hostname, context=context)
+    elif base_url.startswith("http://"):
+        hostname = base_url.replace("http://", "")
+        return http.client.HTTPConnection(hostname)
+    return None
+
+def authenticate(connection, username, password):
+    """
+    Authenticates against the console (POST /api/v1/authenticate) and returns the token, or None on failure.
+    """
+    auth_path = "/api/v1/authenticate"
+    auth_payload = json.dumps({
+        "username": username,
+        "password": password
+    })
+
+    headers = {
+        "Content-Type": "application/json"
+    }
+
+    # Send authentication request
+    connection.request("POST", auth_path, body=auth_payload, headers=headers)
+    response = connection.getresponse()
+
+    if response.status != 200:
+        print(f"Failed to login. HTTP Status Code: {response.status}")
+        print(response.read().decode())
+        return None
+
+    # Read the authentication token from the response
+    response_data = response.read().decode()
+    token_data = json.loads(response_data)
+    token = token_data.get("token")
+
+    if not token:
+        print("Failed to retrieve authentication token.")
+        return None
+
+    return token
+
+class TwistlockClient:
+    """
+    Reusable Twistlock (Prisma Cloud Compute) API client.
+
+    Requests go over a small pool of kept-alive connections, so result pages can be
+    fetched concurrently and reassembled in order. When the token expires mid-run
+    (HTTP 401) the client re-authenticates against /api/v1/authenticate once and
+    retries the request; concurrent requests that hit the same expiry share the
+    refreshed token. Any base URL works, including a local mock console over http://.
+
+    Usage:
+        with TwistlockClient(base_url, username, password, pool_size=8) as client:
+            for record in client.iter_records("/api/v1/vulnerabilities/host"):
+                ...
+    """
+
+    def __init__(self, base_url, username, password, pool_size=4, page_size=PAGE_SIZE, timeout=60):
+        if not base_url.startswith(("https://", "http://")):
+            raise ValueError("Invalid URL format. Please include 'http://' or 'https://'.")
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.pool_size = max(1, pool_size)
+        # A limit above the console's cap would come back as short pages
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        self.timeout = timeout
+
+        # Connections connect lazily, so the pool can be filled up front
+        self._pool = queue.Queue()
+        for _ in range(self.pool_size):
+            self._pool.put(self._new_connection())
+
+        self._token = None
+        self._token_generation = 0
+        self._auth_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_connection(self):
+        connection = open_connection(self.base_url)
+        connection.timeout = self.timeout
+        return connection
+
+    def _refresh_token(self, stale_generation):
+        """Re-authenticates unless another thread already replaced the token from stale_generation."""
+        with self._auth_lock:
+            if self._token is not None and self._token_generation != stale_generation:
+                return
+            connection = self._pool.get()
+            try:
+                token = authenticate(connection, self.username, self.password)
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                raise
+            finally:
+                self._pool.put(connection)
+            if not token:
+                raise RuntimeError("Authentication against /api/v1/authenticate failed.")
+            self._token = token
+            self._token_generation += 1
+
+    def login(self):
+        """Authenticates now; raises RuntimeError if the console rejects the credentials."""
+        self._refresh_token(self._token_generation)
+
+    def request_json(self, method, path, params=None, body=None):
+        """
+        Sends a request with the current token and returns the parsed JSON response.
+        Re-authenticates and retries once on HTTP 401, reconnects and retries once on a
+        dropped connection, and raises RuntimeError on any other non-200 status.
+        """
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        payload = json.dumps(body) if body is not None else None
+
+        if self._token is None:
+            self.login()
+
+        reauthenticated = reconnected = False
+        while True:
+            generation, token = self._token_generation, self._token
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+
+            connection = self._pool.get()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()  # Read fully so the connection can be reused
+            except (http.client.HTTPException, OSError):
+                # Kept-alive connections can be dropped by the console; retry once on a fresh one
+                connection.close()
+                if reconnected:
+                    raise
+                reconnected = True
+                continue
+            finally:
+                self._pool.put(connection)
+
+            if response.status == 401 and not reauthenticated:
+                reauthenticated = True
+                self._refresh_token(generation)
+                continue
+
+            if response.status != 200:
+                raise RuntimeError(f"{method} {path} failed. HTTP Status Code: {response.status}: "
+                                   f"{data.decode(errors='replace')}")
+            return json.loads(data) if data else None
+
+    def get_page(self, path, offset, params=None, limit=None):
+        """Returns one page (limit records, default page_size) of a list endpoint as a list (empty past the last page)."""
+        page_params = dict(params or {})
+        page_params.update({"offset": offset, "limit": limit or self.page_size})
+        return self.request_json("GET", path, page_params) or []  # The console returns null past the last page
+
+    def iter_pages(self, path, params=None):
+        """
+        Yields the non-empty pages of a list endpoint in order. Up to pool_size pages are
+        in flight at once, and paging stops at the first empty page.
+
+        A short page is either the last one or a sign that the console caps limit below
+        page_size. Either way the pages in flight are dropped and paging resumes right
+        after the short page with its length as the page size, so a lower cap costs one
+        round of requests instead of silently skipping records.
+        """
+        page_size = self.page_size
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            pending = deque()  # (offset, future)
+            offset = 0
+            try:
+                while True:
+                    while len(pending) < self.pool_size:
+                        pending.append((offset, executor.submit(self.get_page, path, offset, params, page_size)))
+                        offset += page_size
+
+                    page_offset, future = pending.popleft()
+                    page = future.result()
+                    if not page:
+                        break
+                    yield page
+
+                    if len(page) < page_size:
+                        for _, future in pending:
+                            future.cancel()
+                        pending.clear()
+                        page_size = len(page)
+                        offset = page_offset + page_size
+            finally:
+                # Pages requested past the end (or after an error) are not needed
+                for _, future in pending:
+                    future.cancel()
+
+    def iter_records(self, path, params=None):
+        """Yields every record of a list endpoint, in console order."""
+        for page in self.iter_pages(path, params):
+            yield from page
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+def download_twistlock_vulnerability_scans(base_url, username, password, output_file='vulnerability_report.json',
+                                           page_size=PAGE_SIZE, compress=None, workers=1, snapshot_dir=None):
     """
     Function to download vulnerability scans from a Twistlock (Prisma Cloud) server using http.client.
 
@@ -11,84 +246,65 @@ def download_twistlock_vulnerability_scans(base_url, username, password, output_
     - username: API username.
     - password: API password.
     - output_file: File where the downloaded report will be saved (default is 'vulnerability_report.json').
+    - page_size: Records requested per page (at most MAX_PAGE_SIZE).
+    - compress: Write the report gzip-compressed (default: when output_file ends with '.gz').
+    - workers: Number of pages fetched concurrently (one kept-alive connection each).
+    - snapshot_dir: Also record the download as a run in this scan_snapshots store.
+
+    Results are paged with offset/limit and each page is written to disk as it arrives,
+    so memory use is bounded by the pages in flight. The report is a JSON array of host
+    records, written to a temp file and renamed into place when complete.
 
     Returns:
     - None (downloads the report to the specified file).
     """
 
-    try:
-        # Disable SSL certificate verification (optional: only if required)
-        context = ssl._create_unverified_context()
-
-        # Extract the hostname and determine if it's an HTTPS connection
-        if base_url.startswith("https://"):
-            hostname = base_url.replace("https://", "")
-            connection = http.client.HTTPSConnection(hostname, context=context)
-        elif base_url.startswith("http://"):
-            hostname = base_url.replace("http://", "")
-            connection = http.client.HTTPConnection(hostname)
-        else:
-            print("Invalid URL format. Please include 'http://' or 'https://'.")
-            return
-
-        # Step 1: Authenticate and get the token (POST /api/v1/authenticate)
-        auth_path = "/api/v1/authenticate"
-        auth_payload = json.dumps({
-            "username": username,
-            "password": password
-        })
-
-        headers = {
-            "Content-Type": "application/json"
-        }
-
-        # Send authentication request
-        connection.request("POST", auth_path, body=auth_payload, headers=headers)
-        response = connection.getresponse()
+    if not base_url.startswith(("https://", "http://")):
+        print("Invalid URL format. Please include 'http://' or 'https://'.")
+        return
 
-        if response.status != 200:
-            print(f"Failed to login. HTTP Status Code: {response.status}")
-            print(response.read().decode())
-            return
+    if compress is None:
+        compress = output_file.endswith('.gz')
+    tmp_path = output_file + '.part'
 
-        # Read the authentication token from the response
-        response_data = response.read().decode()
-        token_data = json.loads(response_data)
-        token = token_data.get("token")
+    client = TwistlockClient(base_url, username, password, pool_size=workers, page_size=page_size)
+    snapshot = scan_snapshots.SnapshotWriter(snapshot_dir, source=os.path.basename(output_file)) if snapshot_dir else None
+    try:
+        # Step 1: Authenticate and get the token (POST /api/v1/authenticate)
+        client.login()
+        print("Successfully authenticated.")
 
-        if not token:
-            print("Failed to retrieve authentication token.")
-            return
+        # Step 2: Page through the vulnerability scan report (GET /api/v1/vulnerabilities/host)
+        vuln_report_path = "/api/v1/vulnerabilities/host"
+        record_count = 0
+        opener = gzip.open if compress else open
+        with opener(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write("[")
+            for record in client.iter_records(vuln_report_path):
+                if record_count:
+                    f.write(",\n")
+                f.write(json.dumps(record))
+                record_count += 1
+                if snapshot:
+                    snapshot.add(record)
+            f.write("]\n")
 
-        print(f"Successfully authenticated. Token: {token}")
+        os.replace(tmp_path, output_file)
+        print(f"Vulnerability scan report saved to {output_file} ({record_count} records).")
 
-        # Step 2: Fetch the vulnerability scan report (GET /api/v1/vulnerabilities/host)
-        vuln_report_path = "/api/v1/vulnerabilities/host"
-        
-        # Headers with the Bearer token
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
-        # Send GET request to retrieve the vulnerability report
-        connection.request("GET", vuln_report_path, headers=headers)
-        response = connection.getresponse()
-
-        if response.status == 200:
-            # Read and save the report
-            report_data = response.read().decode()
-            with open(output_file, 'w') as f:
-                f.write(report_data)
-            print(f"Vulnerability scan report saved to {output_file}.")
-        else:
-            print(f"Failed to retrieve vulnerability scans. HTTP Status Code: {response.status}")
-            print(response.read().decode())
+        if snapshot:
+            run_id = snapshot.commit()
+            print(f"Recorded snapshot run {run_id} ({snapshot.new_objects} new records).")
+            snapshot = None
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
     finally:
-        connection.close()
+        client.close()
+        if snapshot:
+            snapshot.abort()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,222 @@
+import argparse
+import getpass
+import gzip
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from tlapi import PAGE_SIZE, TwistlockClient
+
+# Incremental sync of Twistlock host and image scans into a local keyed snapshot store.
+#
+# sync_checkpoints keeps, per kind, the newest scanTime stored (the checkpoint) and
+# when the estate was last listed in full. A delta sync lists only the _id and
+# scanTime of records scanned since the checkpoint, newest first, and stops at the
+# first older record; a full sync lists every record. Either way the full scan is
+# downloaded only for records that are new or whose scanTime changed. Records missing
+# from a full listing are looked up again by _id before they are dropped, since
+# offset paging over a console whose data changes mid-listing can skip records.
+# The store can be exported back to a JSON report at any time.
+
+SNAPSHOT_DB = os.environ.get('TL_SNAPSHOT_DB', 'twistlock_snapshot.db')
+
+# kind -> (list endpoint, query parameter that filters it by _id)
+SYNC_KINDS = {
+    'host': ('/api/v1/hosts', 'hostname'),
+    'image': ('/api/v1/images', 'id'),
+}
+
+# Delta listings go this far (seconds) behind the checkpoint, to catch records whose
+# scan finished while the previous sync was listing
+SCAN_TIME_OVERLAP = 3600
+
+# A sync lists the whole estate (and detects removed records) when the last full
+# listing is older than this many seconds
+FULL_SYNC_INTERVAL = 24 * 3600
+
+def open_store(db_path=SNAPSHOT_DB):
+    """Opens (creating if needed) the snapshot store."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_records (
+            kind TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            scan_time TEXT,
+            body TEXT NOT NULL,
+            PRIMARY KEY (kind, record_id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_checkpoints (
+            kind TEXT PRIMARY KEY,
+            synced_at REAL NOT NULL,
+            records INTEGER NOT NULL
+        )
+    """)
+    # Stores created before the scan-time checkpoint lack these columns
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(sync_checkpoints)")}
+    for column, column_type in (('latest_scan_time', 'TEXT'), ('full_synced_at', 'REAL')):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE sync_checkpoints ADD COLUMN {column} {column_type}")
+    return conn
+
+def parse_scan_time(value):
+    """Returns a scanTime (ISO 8601, e.g. 2024-05-01T12:00:00.123Z) as an aware datetime, or None."""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+def list_scan_times(client, kind):
+    """Returns {_id: scanTime} for every record of a kind, fetching only those two fields."""
+    path, _ = SYNC_KINDS[kind]
+    return {record['_id']: record.get('scanTime')
+            for record in client.iter_records(path, {'fields': '_id,scanTime'})}
+
+def list_scanned_since(client, kind, since):
+    """
+    Returns {_id: scanTime} for the records of a kind scanned at or after since (a datetime),
+    listing newest first and stopping at the first older record.
+    """
+    path, _ = SYNC_KINDS[kind]
+    params = {'fields': '_id,scanTime', 'sort': 'scanTime', 'reverse': 'true'}
+    listed = {}
+    for record in client.iter_records(path, params):
+        scanned = parse_scan_time(record.get('scanTime'))
+        if scanned is not None and scanned < since:
+            break
+        listed[record['_id']] = record.get('scanTime')
+    return listed
+
+def fetch_records(client, kind, record_ids):
+    """Yields the full scan records for the given IDs, fetched in ID batches over the client's pool."""
+    path, id_param = SYNC_KINDS[kind]
+    batches = [record_ids[i:i + client.page_size] for i in range(0, len(record_ids), client.page_size)]
+    with ThreadPoolExecutor(max_workers=client.pool_size) as executor:
+        for page in executor.map(lambda batch: client.get_page(path, 0, {id_param: ','.join(batch)}), batches):
+            yield from page
+
+def sync_kind(client, conn, kind, full=None):
+    """
+    Brings the stored records of one kind up to date with the console. Lists only records
+    scanned since the checkpoint, unless full is true, there is no checkpoint yet, or
+    (with full=None) the last full listing is older than FULL_SYNC_INTERVAL.
+    Returns (records listed, records downloaded, records removed, True if the listing was full).
+    """
+    checkpoint = conn.execute(
+        "SELECT latest_scan_time, full_synced_at FROM sync_checkpoints WHERE kind = ?", (kind,)
+    ).fetchone() or (None, None)
+    latest_scan_time, full_synced_at = checkpoint
+    since = parse_scan_time(latest_scan_time)
+    if full is None:
+        full = full_synced_at is None or time.time() - full_synced_at >= FULL_SYNC_INTERVAL
+    full = full or since is None
+
+    started = time.time()
+    if full:
+        listed = list_scan_times(client, kind)
+    else:
+        listed = list_scanned_since(client, kind, since - timedelta(seconds=SCAN_TIME_OVERLAP))
+    stored = dict(conn.execute("SELECT record_id, scan_time FROM scan_records WHERE kind = ?", (kind,)))
+
+    changed = [record_id for record_id, scan_time in listed.items() if stored.get(record_id, object()) != scan_time]
+    # Records missing from a full listing may only have been skipped by paging: look them up by _id
+    missing = [record_id for record_id in stored if record_id not in listed] if full else []
+
+    downloaded = 0
+    found = set()
+    with conn:
+        for record in fetch_records(client, kind, changed + missing):
+            conn.execute(
+                "INSERT OR REPLACE INTO scan_records (kind, record_id, scan_time, body) VALUES (?, ?, ?, ?)",
+                (kind, record['_id'], record.get('scanTime'), json.dumps(record))
+            )
+            downloaded += 1
+            found.add(record['_id'])
+        removed = [record_id for record_id in missing if record_id not in found]
+        conn.executemany("DELETE FROM scan_records WHERE kind = ? AND record_id = ?",
+                         [(kind, record_id) for record_id in removed])
+
+        # The checkpoint only moves forward, to the newest scanTime now stored
+        scan_times = [scan_time for scan_time in listed.values() if parse_scan_time(scan_time)]
+        if latest_scan_time:
+            scan_times.append(latest_scan_time)
+        newest = max(scan_times, key=parse_scan_time, default=None)
+        record_count = conn.execute("SELECT COUNT(*) FROM scan_records WHERE kind = ?", (kind,)).fetchone()[0]
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_checkpoints (kind, synced_at, latest_scan_time, full_synced_at, records) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (kind, started, newest, started if full else full_synced_at, record_count)
+        )
+
+    return len(listed), downloaded, len(removed), full
+
+def sync_scans(base_url, username, password, kinds=('host', 'image'), db_path=SNAPSHOT_DB,
+               workers=4, page_size=PAGE_SIZE, full=None):
+    """Runs an incremental sync of the given kinds and prints a summary line per kind."""
+    conn = open_store(db_path)
+    try:
+        with TwistlockClient(base_url, username, password, pool_size=workers, page_size=page_size) as client:
+            for kind in kinds:
+                start_time = time.time()
+                listed, downloaded, removed, was_full = sync_kind(client, conn, kind, full)
+                print(f"{kind}: {'full' if was_full else 'delta'} listing of {listed}, "
+                      f"{downloaded} downloaded, {removed} removed ({time.time() - start_time:.1f}s)")
+    finally:
+        conn.close()
+
+def export_snapshot(kind, output_file, db_path=SNAPSHOT_DB):
+    """
+    Writes the stored records of a kind as a JSON array (gzip-compressed if output_file
+    ends with '.gz'), in the same layout as tlapi's downloaded report. Returns the record count.
+    """
+    conn = open_store(db_path)
+    tmp_path = output_file + '.part'
+    opener = gzip.open if output_file.endswith('.gz') else open
+    record_count = 0
+    try:
+        with opener(tmp_path, 'wt', encoding='utf-8') as f:
+            f.write("[")
+            for (body,) in conn.execute("SELECT body FROM scan_records WHERE kind = ? ORDER BY record_id", (kind,)):
+                if record_count:
+                    f.write(",\n")
+                f.write(body)
+                record_count += 1
+            f.write("]\n")
+        os.replace(tmp_path, output_file)
+    finally:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    print(f"Exported {record_count} {kind} records to {output_file}.")
+    return record_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync Twistlock host/image scans into a local snapshot store.")
+    parser.add_argument('--url', required=True, help="Console URL including http:// or https://")
+    parser.add_argument('--user', required=True, help="API username")
+    parser.add_argument('--kind', nargs='+', choices=sorted(SYNC_KINDS), default=['host', 'image'],
+                        help="Record kinds to sync (default: host image)")
+    parser.add_argument('--db', default=SNAPSHOT_DB, help=f"Snapshot store path (default: {SNAPSHOT_DB})")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent requests (default: 4)")
+    parser.add_argument('--full', action='store_true',
+                        help="List every record (and drop removed ones) instead of only those scanned since the "
+                             f"checkpoint; done automatically every {FULL_SYNC_INTERVAL // 3600} hours")
+    parser.add_argument('--export', metavar='FILE',
+                        help="After syncing, export the first --kind to this JSON report (.gz to compress)")
+    args = parser.parse_args()
+
+    # The password is read from the environment or prompted for, never passed on the command line
+    password = os.environ.get('TWISTLOCK_PASSWORD') or getpass.getpass("Password: ")
+
+    sync_scans(args.url, args.user, password, args.kind, args.db, args.workers, full=args.full or None)
+    if args.export:
+        export_snapshot(args.kind[0], args.export, args.db)
@@ -0,0 +1,240 @@
+import csv
+import hashlib
+import json
+import locale
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+# Columnar cache of normalized Twistlock vulnerability rows.
+#
+# Each source CSV is converted once into a .vcol file holding one dictionary-
+# encoded column per field: a JSON header with the distinct values of every
+# column, followed by one uint32 code array per column. Later reads memory-map
+# the file instead of re-tokenizing the CSV. The cache is rebuilt whenever the
+# source file's size or mtime changes. Source CSVs are decoded with the locale's
+# default encoding, as the scripts did before the cache; a cache built under a
+# different encoding is rebuilt.
+#
+# Caches are kept next to the source files unless VULN_CACHE_DIR is set. If the
+# cache cannot be written (e.g. a read-only share), the columns are encoded in
+# memory for that read instead.
+
+COLUMNS = ['Environment', 'CVE', 'Severity', 'Type', 'Package', 'Published', 'Fix Date', 'Discovered']
+
+MAGIC = b'VCOL0001'
+CACHE_DIRNAME = '.vcol'
+
+# Optional central cache folder, used instead of <folder>/.vcol when set
+CACHE_ROOT = os.environ.get('VULN_CACHE_DIR')
+
+def default_cache_path(csv_path):
+    """
+    Returns the cache file path for a CSV: <folder>/.vcol/<filename>.vcol, or
+    <VULN_CACHE_DIR>/<folder hash>/<filename>.vcol when VULN_CACHE_DIR is set.
+    """
+    folder, filename = os.path.split(csv_path)
+    if CACHE_ROOT:
+        folder_key = hashlib.sha1(os.path.abspath(folder).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(CACHE_ROOT, folder_key, filename + '.vcol')
+    return os.path.join(folder, CACHE_DIRNAME, filename + '.vcol')
+
+def normalize_row(row, environment):
+    """Maps a Twistlock CSV row (DictReader) to the normalized columns, in COLUMNS order."""
+    # Consolidated files already carry Environment/Package; raw exports derive them
+    if row.get('Environment') is not None:
+        environment = row['Environment'].strip()
+    if row.get('Package') is not None:
+        package = row['Package'].strip()
+    else:
+        package = (row.get('Package Name') or '').strip() + " " + (row.get('Installed Version') or '').strip()
+
+    return (
+        environment,
+        (row.get('CVE') or '').strip(),
+        (row.get('Severity') or '').strip(),
+        (row.get('Type') or '').strip(),
+        package,
+        (row.get('Published') or '').strip(),
+        (row.get('Fix Date') or '').strip(),
+        (row.get('Discovered') or '').strip(),
+    )
+
+def encode_csv(csv_path):
+    """Dictionary-encodes a Twistlock CSV. Returns (cache header, uint32 code array per column)."""
+    environment = os.path.basename(csv_path).split(" ")[0]
+    stat = os.stat(csv_path)
+
+    # Dictionary-encode every column while streaming through the CSV
+    dictionaries = [{} for _ in COLUMNS]
+    codes = [array('I') for _ in COLUMNS]
+    with open(csv_path, mode='r', newline='') as infile:
+        reader = csv.DictReader(infile)
+        source_fields = reader.fieldnames or []
+        for row in reader:
+            for idx, value in enumerate(normalize_row(row, environment)):
+                code = dictionaries[idx].get(value)
+                if code is None:
+                    code = dictionaries[idx][value] = len(dictionaries[idx])
+                codes[idx].append(code)
+
+    row_count = len(codes[0])
+    header = {
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_fields': source_fields,
+        'encoding': locale.getpreferredencoding(False),
+        'byteorder': sys.byteorder,
+        'rows': row_count,
+        'columns': [{'name': name, 'values': list(dictionaries[idx])} for idx, name in enumerate(COLUMNS)],
+    }
+    return header, codes
+
+def write_cache(cache_path, header, codes):
+    """Writes encoded columns to a cache file."""
+    # Column arrays start on a 4-byte boundary so they can be cast from the mmap
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = len(MAGIC) + 4 + len(header_bytes)
+    padding = -data_offset % 4
+
+    # A unique temp file, so concurrent builds of the same cache don't overwrite each other
+    folder = os.path.dirname(cache_path) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode='wb') as outfile:
+            outfile.write(MAGIC)
+            outfile.write(struct.pack('<I', len(header_bytes)))
+            outfile.write(header_bytes)
+            outfile.write(b'\0' * padding)
+            for column in codes:
+                column.tofile(outfile)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def build_cache(csv_path, cache_path=None):
+    """Converts a Twistlock CSV into a columnar cache file and returns its path."""
+    cache_path = cache_path or default_cache_path(csv_path)
+    write_cache(cache_path, *encode_csv(csv_path))
+    return cache_path
+
+class VulnColumns:
+    """Read-only, memory-mapped view of a columnar cache file."""
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._file = open(cache_path, mode='rb')
+        self._views = []
+        try:
+            if self._file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{cache_path} is not a columnar cache file")
+            (header_len,) = struct.unpack('<I', self._file.read(4))
+            self.header = json.loads(self._file.read(header_len).decode('utf-8'))
+            data_offset = len(MAGIC) + 4 + header_len
+            data_offset += -data_offset % 4
+            self.rows = self.header['rows']
+            self.source_fields = self.header['source_fields']
+            self._values = {column['name']: column['values'] for column in self.header['columns']}
+            self._offsets = {name: data_offset + idx * self.rows * 4 for idx, name in enumerate(COLUMNS)}
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.rows else None
+        except Exception:
+            self._file.close()
+            raise
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_fresh(self, csv_path):
+        """True if the cache still matches the source CSV's size and mtime and the current encoding."""
+        try:
+            stat = os.stat(csv_path)
+        except OSError:
+            return False
+        return (self.header.get('byteorder') == sys.byteorder
+                and self.header.get('encoding') == locale.getpreferredencoding(False)
+                and self.header['source_size'] == stat.st_size
+                and self.header['source_mtime_ns'] == stat.st_mtime_ns)
+
+    def values(self, name):
+        """Distinct values of a column, indexed by code."""
+        return self._values[name]
+
+    def codes(self, name):
+        """uint32 code array of a column (a memoryview over the mapped file)."""
+        if not self.rows:
+            return memoryview(array('I'))
+        offset = self._offsets[name]
+        view = memoryview(self._mmap)[offset:offset + self.rows * 4].cast('I')
+        self._views.append(view)
+        return view
+
+    def column(self, name):
+        """Decoded values of a column as a list of strings."""
+        values = self._values[name]
+        return [values[code] for code in self.codes(name)]
+
+    def iter_rows(self):
+        """Yields each row as a tuple in COLUMNS order."""
+        return zip(*(self.column(name) for name in COLUMNS))
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+class MemoryColumns(VulnColumns):
+    """VulnColumns over columns encoded in memory, used when the cache file cannot be written."""
+
+    def __init__(self, header, codes):
+        self.cache_path = None
+        self.header = header
+        self.rows = header['rows']
+        self.source_fields = header['source_fields']
+        self._values = {column['name']: column['values'] for column in header['columns']}
+        self._codes = dict(zip(COLUMNS, codes))
+
+    def codes(self, name):
+        return memoryview(self._codes[name])
+
+    def close(self):
+        pass
+
+def load_columns(csv_path, cache_path=None):
+    """
+    Returns a VulnColumns view of a Twistlock CSV, (re)building the cache if missing or stale.
+    Falls back to in-memory columns if the cache cannot be written.
+    """
+    cache_path = cache_path or default_cache_path(csv_path)
+    if os.path.exists(cache_path):
+        try:
+            columns = VulnColumns(cache_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Rebuilding unreadable cache {cache_path}: {e}")
+        else:
+            if columns.is_fresh(csv_path):
+                return columns
+            columns.close()
+
+    header, codes = encode_csv(csv_path)
+    try:
+        write_cache(cache_path, header, codes)
+    except OSError as e:
+        print(f"Cannot write cache {cache_path} ({e}); reading {csv_path} without it.")
+        return MemoryColumns(header, codes)
+    return VulnColumns(cache_path)
@@ -0,0 +1,174 @@
+import argparse
+import csv
+import os
+import tempfile
+import zlib
+from datetime import datetime
+
+from delta2 import OUTPUT_HEADER, calculate_compliance_batch
+from vuln_cache import normalize_row
+
+# Diff of two vulnerability snapshots: two dated copies of the _Vuln folder, or two
+# all_environments.csv files written by delta2.py.
+#
+# Findings are keyed on (Environment, CVE, Package). The diff is a partitioned (Grace)
+# hash join: both snapshots are first streamed into PARTITIONS bucket files by the
+# CRC32 of the key, then each bucket pair is joined in memory. Every row is read and
+# written a fixed number of times, and memory is bounded by one bucket of the old
+# snapshot rather than by the size of either input. Snapshot folders are only read;
+# nothing (not even the columnar cache) is written into them.
+
+KEY_COLUMNS = [OUTPUT_HEADER.index(name) for name in ('Environment', 'CVE', 'Package')]
+
+PARTITIONS = 64
+
+# Rows per Compliance Date / Days Overdue batch when reading a snapshot folder
+COMPLIANCE_CHUNK = 50000
+
+# Result files written to the output folder, one per finding status
+RESULT_FILES = {
+    'new': 'new_findings.csv',
+    'fixed': 'fixed_findings.csv',
+    'persisting': 'persisting_findings.csv',
+}
+
+def iter_folder_rows(folder_path, today=None):
+    """
+    Yields the rows of every environment CSV in a _Vuln folder in delta2's output layout,
+    streaming each file and computing Compliance Date / Days Overdue in chunks.
+    """
+    today = today or datetime.now()
+    filenames = sorted(filename for filename in os.listdir(folder_path) if filename.endswith('.csv'))
+    for filename in filenames:
+        environment = filename.split(" ")[0]
+        with open(os.path.join(folder_path, filename), mode='r', newline='', encoding='utf-8', errors='replace') as infile:
+            chunk = []
+            for row in csv.DictReader(infile):
+                chunk.append(list(normalize_row(row, environment)))
+                if len(chunk) >= COMPLIANCE_CHUNK:
+                    yield from _add_compliance(chunk, today)
+                    chunk = []
+            yield from _add_compliance(chunk, today)
+
+def _add_compliance(rows, today):
+    compliance_dates, days_overdue = calculate_compliance_batch([row[7] for row in rows], [row[2] for row in rows], today)
+    for row, compliance_date, overdue in zip(rows, compliance_dates, days_overdue):
+        row.extend([compliance_date, overdue])
+    return rows
+
+def iter_snapshot_rows(path):
+    """Yields the rows of a snapshot (a _Vuln folder or an all_environments.csv) in delta2's output layout."""
+    if os.path.isdir(path):
+        yield from iter_folder_rows(path)
+        return
+
+    with open(path, mode='r', newline='', encoding='utf-8', errors='replace') as infile:
+        reader = csv.reader(infile)
+        header = next(reader, None) or []
+        missing = [name for name in OUTPUT_HEADER if name not in header]
+        if missing:
+            raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+        indexes = [header.index(name) for name in OUTPUT_HEADER]
+        width = len(header)
+        for row in reader:
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            yield [row[idx] for idx in indexes]
+
+def finding_key(row):
+    return '\0'.join(row[idx].strip() for idx in KEY_COLUMNS)
+
+def partition_rows(rows, folder, prefix, partitions):
+    """Streams rows into partition files <prefix>_<n>.csv by the CRC32 of their key. Returns the row count."""
+    outfiles = [open(os.path.join(folder, f"{prefix}_{n}.csv"), mode='w', newline='', encoding='utf-8')
+                for n in range(partitions)]
+    writers = [csv.writer(outfile) for outfile in outfiles]
+    row_count = 0
+    try:
+        for row in rows:
+            writers[zlib.crc32(finding_key(row).encode('utf-8')) % partitions].writerow(row)
+            row_count += 1
+    finally:
+        for outfile in outfiles:
+            outfile.close()
+    return row_count
+
+def read_partition(folder, prefix, n):
+    with open(os.path.join(folder, f"{prefix}_{n}.csv"), mode='r', newline='', encoding='utf-8') as infile:
+        yield from csv.reader(infile)
+
+def diff_snapshots(old_path, new_path, output_folder, partitions=PARTITIONS):
+    """
+    Writes new, fixed and persisting findings between two snapshots to output_folder
+    (see RESULT_FILES), each in delta2's column layout. New and persisting rows come
+    from the new snapshot, fixed rows from the old one. Duplicate keys within a
+    snapshot are reported once. Returns {status: rows written}.
+
+    Rows are written bucket by bucket, so their order follows the key hash: it is the
+    same on every run over the same inputs with the same partitions, but changes if
+    the number of partitions changes. Sort the results if a fixed order is needed.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    counts = dict.fromkeys(RESULT_FILES, 0)
+
+    with tempfile.TemporaryDirectory(dir=output_folder) as work_dir:
+        # Pass 1: partition both snapshots by key
+        old_rows = partition_rows(iter_snapshot_rows(old_path), work_dir, 'old', partitions)
+        new_rows = partition_rows(iter_snapshot_rows(new_path), work_dir, 'new', partitions)
+        print(f"Partitioned {old_rows} old and {new_rows} new rows into {partitions} buckets.")
+
+        # Pass 2: join each bucket pair
+        outfiles = {status: open(os.path.join(output_folder, filename + '.part'), mode='w', newline='', encoding='utf-8')
+                    for status, filename in RESULT_FILES.items()}
+        try:
+            writers = {status: csv.writer(outfile) for status, outfile in outfiles.items()}
+            for writer in writers.values():
+                writer.writerow(OUTPUT_HEADER)
+
+            for n in range(partitions):
+                old_bucket = {}
+                for row in read_partition(work_dir, 'old', n):
+                    old_bucket.setdefault(finding_key(row), row)
+
+                matched = set()
+                seen = set()
+                for row in read_partition(work_dir, 'new', n):
+                    key = finding_key(row)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    status = 'persisting' if key in old_bucket else 'new'
+                    if status == 'persisting':
+                        matched.add(key)
+                    writers[status].writerow(row)
+                    counts[status] += 1
+
+                for key, row in old_bucket.items():
+                    if key not in matched:
+                        writers['fixed'].writerow(row)
+                        counts['fixed'] += 1
+        except BaseException:
+            for status, outfile in outfiles.items():
+                outfile.close()
+                os.remove(outfile.name)
+            raise
+
+    for status, outfile in outfiles.items():
+        outfile.close()
+        os.replace(outfile.name, os.path.join(output_folder, RESULT_FILES[status]))
+
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report new, fixed and persisting findings between two vulnerability snapshots.")
+    parser.add_argument('old', help="Older snapshot: a _Vuln folder or an all_environments.csv")
+    parser.add_argument('new', help="Newer snapshot: a _Vuln folder or an all_environments.csv")
+    parser.add_argument('--output', default='_diff', help="Folder for the result files (default: _diff)")
+    parser.add_argument('--partitions', type=int, default=PARTITIONS,
+                        help=f"Hash partitions; raise for very large inputs. Result row order depends "
+                             f"on this value (default: {PARTITIONS})")
+    args = parser.parse_args()
+
+    counts = diff_snapshots(args.old, args.new, args.output, args.partitions)
+    for status, filename in RESULT_FILES.items():
+        print(f"{status}: {counts[status]} rows -> {os.path.join(args.output, filename)}")